@@ -1,21 +1,108 @@
-import nesp_lib
 import asyncio
-import pyvisa
 import time
-from nesp_lib import Port,Pump,PumpingDirection
-# Constructs the port to which the pump is connected.
-port = Port('COM6')
-# Constructs the pump connected to the port.
-pump = Pump(port)
-# Sets the syringe diameter of the pump in units of millimeters.
-pump.syringe_diameter = 30.0
-# Sets the pumping direction of the pump.
-pump.pumping_direction = PumpingDirection.INFUSE
-# Sets the pumping volume of the pump in units of milliliters.
-pump.pumping_volume = 1.0
-# Sets the pumping rate of the pump in units of milliliters per minute.
-pump.pumping_rate = 20.0
-
-pump.run(False)
-
-print("Hello World")
\ No newline at end of file
+from concurrent.futures import ThreadPoolExecutor # dedicated I/O thread for the serial port
+# nesp_lib is imported on first use, so importing this module does not open the serial port.
+
+PUMP_PORT = 'COM6' # serial port to which the pump is connected
+
+#----NE-1000 syringe pump for the PILM process----#
+# All serial I/O runs on one worker thread, so the methods can be awaited inside the PILM loop without blocking it.
+class SyringePump:
+    def __init__(self, portName = PUMP_PORT, address = 0):
+        self.portName = portName
+        self.address = address # address of the pump on the serial bus
+        self._pump = None
+        self._executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = 'pump-io')
+
+    # Opens the port and connects to the pump if that did not happen yet
+    def open(self):
+        if self._pump is None:
+            from nesp_lib import Port, Pump
+            # Constructs the port to which the pump is connected.
+            port = Port(self.portName)
+            # Constructs the pump connected to the port.
+            self._pump = Pump(port, address = self.address)
+            print(f"Connected to syringe pump on {self.portName}")
+        return self._pump
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _configure(self, diameter, rate, volume, infuse):
+        from nesp_lib import PumpingDirection
+        pump = self.open()
+        pump.syringe_diameter = diameter # in units of millimeters.
+        pump.pumping_direction = PumpingDirection.INFUSE if infuse else PumpingDirection.WITHDRAW
+        pump.pumping_volume = volume # in units of milliliters.
+        pump.pumping_rate = rate # in units of milliliters per minute.
+
+    def _status(self):
+        pump = self.open()
+        return {
+            'running': pump.running,
+            'volume_infused': pump.volume_infused,
+            'volume_withdrawn': pump.volume_withdrawn,
+        }
+
+    # Sets diameter (mm), rate (ml/min) and volume (ml) | only needed once, the pump keeps the settings
+    async def configure(self, diameter = 30.0, rate = 20.0, volume = 1.0, infuse = True):
+        await self._run(self._configure, diameter, rate, volume, infuse)
+
+    # Starts pumping the configured volume | Returns right away, see waitUntilDone
+    async def start(self):
+        await self._run(lambda: self.open().run(False))
+
+    async def stop(self):
+        await self._run(lambda: self.open().stop())
+
+    # Returns {'running': bool, 'volume_infused': ml, 'volume_withdrawn': ml}
+    async def status(self):
+        return await self._run(self._status)
+
+    # Polls the pump until the configured volume is pumped | Stops the pump if this times out or is cancelled
+    async def waitUntilDone(self, interval = 0.2, timeout = None):
+        async def poll():
+            while (await self.status())['running']:
+                await asyncio.sleep(interval)
+        try:
+            await asyncio.wait_for(poll(), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            await asyncio.shield(self.stop()) # shielded, so a second cancel can't leave the pump running
+            raise
+
+    # Pumps the configured volume and returns once it's done
+    async def infuse(self, timeout = None):
+        await self.start()
+        await self.waitUntilDone(timeout = timeout)
+
+    # Publishes the pump status every interval seconds as topic 'Pump' on the event bus of the client (client.bus)
+    async def streamStatus(self, bus, interval = 0.5):
+        while True:
+            status = await self.status()
+            bus.publish({
+                'topic': 'Pump',
+                'data': [{'name': name, 'value': value, 'timestamp': time.time()} for name, value in status.items()]
+            })
+            await asyncio.sleep(interval)
+
+    # Starts streamStatus in the background and returns the task | cancel the task to stop streaming
+    def startStreaming(self, bus, interval = 0.5):
+        return asyncio.create_task(self.streamStatus(bus, interval))
+
+# Lazy factory for the pump | The port is only opened the first time the pump is needed
+_pump = None
+def getPump(portName = PUMP_PORT):
+    global _pump
+    if _pump is None:
+        _pump = SyringePump(portName)
+    return _pump
+
+async def main():
+    pump = getPump()
+    await pump.configure(diameter = 30.0, rate = 20.0, volume = 1.0)
+    await pump.start()
+
+    print("Hello World")
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -5,7 +5,9 @@ import websockets
 import decorator
 
 import itertools, json, sys, os
+import contextlib
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from pymongo import MongoClient
 
@@ -15,6 +17,9 @@ import logging
 logger = logging.getLogger(__package__)
 
 import AconitySTUDIO_utils as utils
+import AconitySTUDIO_events as events
+import AconitySTUDIO_database as database
+import AconitySTUDIO_telemetry as telemetry
 
 class AconitySTUDIO_client:
     '''
@@ -38,15 +43,54 @@ class AconitySTUDIO_client:
         self.time_between_pings = 25
         self.studio_version = 1
 
-        # ws handling
-        self.processors = []
+        # http connection pool (the session itself is created in create())
+        self.connection_limit = login_data.get('connection_limit', 10)
+        self.keepalive_timeout = login_data.get('keepalive_timeout', 60)
+        self._session = None
+        self._tasks = []
+
+        # ws handling (one websocket connection, messages are distributed via self.bus)
+        self.bus = events.EventBus()
+        self._ws = None
+        self.ws_processing_task = None # receives the websocket messages, see _receive_websocket_data
+        self._ws_connected = asyncio.Event()
+        # reconnect after the connection was lost, see _receive_websocket_data
+        self.ws_reconnect = login_data.get('ws_reconnect', True)
+        self.ws_reconnect_delay = login_data.get('ws_reconnect_delay', 0.5)
+        self.ws_reconnect_max_delay = login_data.get('ws_reconnect_max_delay', 30)
+        # registrations sent after every (re)connect ((type, name) -> task), reports needed internally:
+        # run (channel state) and cmds (AddLayerCommand counter)
+        self._registrations = {(report, report): {'type': report, 'name': report, 'task': 'register'}
+                               for report in ('run', 'cmds')}
+        self._registered = set() # registrations sent on the current connection
+        self._ws_disconnected_at = None # (time.time(), time.monotonic()) of the lost connection
+        self.ws_metrics = {
+            'connects': 0,
+            'reconnects': 0,
+            'last_reconnect_s': None, # duration of the last interruption
+            'max_reconnect_s': 0.0,
+            'disconnected_s': 0.0, # total time without connection
+            'gaps': deque([], maxlen = 100), # (start, end) unix times of the last interruptions
+        }
+        self.processors = [] # functions processor(client, msg) called for every message, see add_processor
+        self._processor_runners = {} # processor -> events.ProcessorRunner (topics, policy, queue), see add_processor
+        self._thread_pool = None
+        self._process_pool = None
+        self.ws_stats = {'received': 0, 'skipped': 0} # skipped: frames not parsed because nobody needed them
         self.msg_json = {}
-        self.ws_messages = deque([])
+        # recent numeric values of the websocket messages ((topic, signal) -> ring buffer), see telemetry()
+        # Only the recorded topics count as used, frames of unused topics are not parsed (see _wants_topic)
+        self.telemetry_store = telemetry.TelemetryStore(login_data.get('telemetry_capacity', 10000),
+                                                        login_data.get('telemetry_topics', ['Positioning']))
 
         # book keeping
         self.history = deque([], maxlen = 15) #history of GET, POST requests
+        self.latencies = deque([], maxlen = 1000) #(method, url, seconds) of the last http requests
         self.job_info = {'AddLayerCommands': 0} # saves layer information for a job (start, end, number of AddLayerCommand's)
+        self.positions = {} # last known axis positions, filled from the Positioning topic (see wait_for_position)
+        self._position_tracking = None
         self.pymongo_database = False
+        self._db_sink = None # database.MongoSink, see enable_pymongo_database
         self.start_time = time.time()
         self.blocked = {
             'manual': False,
@@ -63,7 +107,14 @@ class AconitySTUDIO_client:
 
         # job management
         self.time_out_script_routes = 5
-        self.savety_sleep = 0.15
+        # cached jobs (job_id -> {'job': JobHandler, 'etag', 'last_modified', 'fetched'}), see _get_job()
+        self.job_cache = {}
+        self.job_cache_ttl = login_data.get('job_cache_ttl', 5)
+        # name -> id of jobs, machines and configurations ({'jobs': {name: id}, ...}), see _resolve().
+        # If login_data has an 'id_cache_file', the ids are saved there (per server) and reused in the next run.
+        self.id_cache_file = login_data.get('id_cache_file')
+        self.id_cache = self._load_id_cache()
+        self._ids_validated = set() # (kind, name) of cached ids already checked against the server in this session
 
         logger.info(f'rest url: {self.rest_url}')
 
@@ -96,6 +147,14 @@ class AconitySTUDIO_client:
         It will also set set up a ping, to ensure the connection will not be lost.
 
         :param login_data: required keys are `rest_url`, `ws_url`, `password` and `email`.
+            Optional keys are `connection_limit` (size of the keep-alive connection pool, default 10)
+            and `keepalive_timeout` (seconds an idle connection is kept open, default 60).
+            `ws_reconnect` (default True), `ws_reconnect_delay` (default 0.5) and `ws_reconnect_max_delay`
+            (default 30) control how a lost websocket connection is opened again.
+            `telemetry_capacity` (samples kept per signal, default 10000) and `telemetry_topics`
+            (topics recorded, default ['Positioning'], None for all) configure the in-memory history, see `telemetry`.
+            With `id_cache_file` (path of a json file) the ids found by get_job_id, get_machine_id
+            and get_config_id are saved and reused in the next run.
         :type login_data: dictionary
 
         Usage::
@@ -108,19 +167,94 @@ class AconitySTUDIO_client:
             }
             client = await AconitySTUDIO_client.create(login_data)
 
+        The client owns a persistent http session which must be closed again,
+        either by calling `close()` or by using the client as async context manager::
+
+            async with await AconitySTUDIO_client.create(login_data) as client:
+                ...
+
         '''
 
         self = AconitySTUDIO_client(login_data)
-        await self._login()
+        self._create_session()
+        try:
+            await self._login()
+
+            self.ws_processing_task = asyncio.create_task(self._receive_websocket_data())
+            self._tasks.append(self.ws_processing_task)
+            self._tasks.append(asyncio.create_task(self._ping(self.time_between_pings)))
+            self._tasks.append(asyncio.create_task(self._track_AddLayerCommand()))
+
+            # wait for the websocket, but fail early if the connection can not be established
+            connected = asyncio.create_task(self._ws_connected.wait())
+            await asyncio.wait({connected, self.ws_processing_task}, return_when = asyncio.FIRST_COMPLETED)
+            if not self._ws_connected.is_set():
+                connected.cancel()
+                self.ws_processing_task.result()
+                raise ConnectionError(f'websocket connection to {self.topic_url} could not be established')
+
+            # Positioning is only sent while an axis moves: register it before the first move is executed,
+            # otherwise a short move can be over before the registration reaches the server
+            await self._ensure_position_tracking()
+        except BaseException:
+            await self.close() # no open session or orphaned background tasks if the client can not be created
+            raise
 
-        self.ws_processing_task = asyncio.create_task(self._receive_websocket_data())
-        asyncio.create_task(self._ping(self.time_between_pings))
-        asyncio.create_task(self._track_AddLayerCommand())
+        logger.info('created client')
+        return self
 
+    def _create_session(self):
+        '''
+        Creates the long-lived http session used for all REST calls.
+        Connections are kept alive and reused from a pool of size `connection_limit`.
 
-        logger.info('created client')
+        The user does not need to call it, see the Factory method `create`.
+        '''
+        connector = aiohttp.TCPConnector(limit = self.connection_limit,
+                                         keepalive_timeout = self.keepalive_timeout)
+        self._session = aiohttp.ClientSession(connector = connector,
+                                              raise_for_status = True)
+        logger.info(f'created http session (connection_limit={self.connection_limit}, '\
+                    f'keepalive_timeout={self.keepalive_timeout})')
+
+    def _open_session(self):
+        '''
+        Returns the http session, or raises a ConnectionError if the client was closed (or never created).
+        Only `create` opens the session, so no session is left unclosed.
+        '''
+        if self._session is None or self._session.closed:
+            raise ConnectionError('the client is closed, use AconitySTUDIO_client.create() to connect again')
+        return self._session
+
+    async def close(self):
+        '''
+        Cancels the background tasks (ping, websocket) and closes the http session.
+        '''
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        await asyncio.gather(*(runner.close() for runner in self._processor_runners.values()))
+        for pool in (self._thread_pool, self._process_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._thread_pool = self._process_pool = None
+
+        if self._db_sink is not None:
+            await self._db_sink.close()
+
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        logger.info('closed client')
+
+    async def __aenter__(self):
         return self
 
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
     async def _ping(self, time=5):
         '''
         If no ping is sent, the connection will be lost after some time.
@@ -181,9 +315,14 @@ class AconitySTUDIO_client:
     # HTTP REQUESTS GET/PUT/POST #
     ##############################
 
-    async def _http_request(self, method, url, log_level='info', headers={}, verbose=False, data=None, timeout = 300):
+    async def _http_request(self, method, url, log_level='info', headers={}, verbose=False, data=None, timeout = 300,
+                            full_response=False):
         '''
         Processes an http request.
+
+        :param full_response: return (status, response headers, body) instead of the body only.
+            A 304 (Not Modified) answer has the body None.
+        :type full_response: bool
         '''
         if method not in ['put','post','get']:
             raise AttributeError('Invalid http request method. Must be put/post/get')
@@ -213,31 +352,40 @@ class AconitySTUDIO_client:
             logger.info(f'different timeout used for script routes: {self.time_out_script_routes}')
         timeout = aiohttp.ClientTimeout(total = timeout)
 
-        async with aiohttp.ClientSession(raise_for_status = True, timeout = timeout) as session:
-            try:
-                #print(f'starting the {url} request')
-                async with session.request(method, url, headers = headers, data = data) as resp:
-                    #print(f'the {url} request answered with status {resp.status}')
-                    if resp.status == 401:
-                        text = await resp.text()
-                        raise Exception(f'It appears The client has lost the connection (something went wrong with the ping?): {text}')
-                    if resp.status == 500:
-                        text = await resp.text()
-                        logger.debug(f'response body 500 error:\n{text}')
-                        logger.error(f'HTML return value 500, {resp.reason}. '\
-                                    f'Return body has been logged with mode debug')
-                    elif resp.status != 200 and resp.status != 500:
-                        logger.error(f'HTML return value: {resp.status}, reason: {resp.reason}')
-                        logger.error(f'{resp.request_info}')
-                    #resp.raise_for_status() #does nothing if resp.status < 400
+        session = self._open_session()
+
+        t_start = time.perf_counter()
+        try:
+            #print(f'starting the {url} request')
+            async with session.request(method, url, headers = headers, data = data, timeout = timeout) as resp:
+                #print(f'the {url} request answered with status {resp.status}')
+                if resp.status == 401:
+                    text = await resp.text()
+                    raise Exception(f'It appears The client has lost the connection (something went wrong with the ping?): {text}')
+                if resp.status == 500:
+                    text = await resp.text()
+                    logger.debug(f'response body 500 error:\n{text}')
+                    logger.error(f'HTML return value 500, {resp.reason}. '\
+                                f'Return body has been logged with mode debug')
+                elif resp.status not in (200, 304, 500):
+                    logger.error(f'HTML return value: {resp.status}, reason: {resp.reason}')
+                    logger.error(f'{resp.request_info}')
+                #resp.raise_for_status() #does nothing if resp.status < 400
+                status, response_headers = resp.status, resp.headers
+                if status == 304:
+                    result = None
+                else:
                     try:
                         result = await resp.json(content_type = None)
                     except Exception as e:
                         logging.exception(f'response is 200, but data is not in json format: {e} . I return response.text() (instead of response.json())')
                         result = await resp.text()
-            except asyncio.TimeoutError:
-                logger.exception('Timeout Error')
-                raise
+        except asyncio.TimeoutError:
+            logger.exception('Timeout Error')
+            raise
+        latency = time.perf_counter() - t_start
+        self.latencies.append((method, url, latency))
+        logger.debug(f'{method} {url} took {latency:.4f} s')
 
         if 'ping' not in url:
             if log_level not in ['info', 'debug', 'error', 'warning']:
@@ -246,6 +394,8 @@ class AconitySTUDIO_client:
 
             getattr(logger, log_level)(f'received:\n{json.dumps(result, indent=3)}')
 
+        if full_response:
+            return status, response_headers, result
         return result
 
     async def get(self, url, log_level='debug', logger=True, headers={}, verbose=False, timeout=300):
@@ -297,16 +447,16 @@ class AconitySTUDIO_client:
     async def download_chunkwise(self, url, save_to, chunk_size = 1024):
         url = self.rest_url + '/' + url
         headers = self._headers
+        session = self._open_session()
         try:
-            async with aiohttp.ClientSession(raise_for_status = True) as session:
-                async with session.get(url, headers = headers) as resp:
-                    logger.info(f'saving batchdata to {save_to}')
-                    with open(save_to, 'wb') as fd:
-                        while True:
-                            chunk = await resp.content.read(chunk_size)
-                            if not chunk:
-                                break
-                            fd.write(chunk)
+            async with session.get(url, headers = headers) as resp:
+                logger.info(f'saving batchdata to {save_to}')
+                with open(save_to, 'wb') as fd:
+                    while True:
+                        chunk = await resp.content.read(chunk_size)
+                        if not chunk:
+                            break
+                        fd.write(chunk)
         except aiohttp.client_exceptions.ClientResponseError:
             logger.exception(f'Something went wrong with {url}. Please check if the file is corrupted in some way.')
             return None
@@ -362,14 +512,18 @@ class AconitySTUDIO_client:
 
         return response
 
-    async def pause_job(self, workunit_id=None, channel_id='run0'):
+    async def pause_job(self, workunit_id=None, channel_id='run0', timeout=None):
         '''
-        Pauses the running script on the given channel and workunit
+        Pauses the running script on the given channel and workunit.
+        Returns once the channel reports that it is paused (i.e. the current layer is finished).
 
         :param workunit_id: the route GET /script yields information about the current workunit_id
         :type workunit_id: string
         :param channel: the route GET /script yields information about the current workunit_id
         :type password: string
+        :param timeout: maximum time in seconds to wait until the channel is paused. None waits forever.
+            If exceeded, raises an asyncio.TimeoutError.
+        :type timeout: float
         '''
         # logger.info(f'trying to pause running script')
         workunit_id = utils._gather(self, logger, 'workunit_id', workunit_id)  # orignally set to _utils.gather, but it was undefined
@@ -383,21 +537,23 @@ class AconitySTUDIO_client:
             number_of_checks = 1
         elif self.studio_version == 2:
             number_of_checks = 1
-        channel_paused = asyncio.create_task(self._wait(channel=channel_id, event='paused', number_of_checks=number_of_checks))
-
-        # post the script
-        await asyncio.sleep(self.savety_sleep) # give the channel_done task a chance to catch the start
 
         url = 'script/' + workunit_id + '/pause/' + channel_id
 
-        try:
-            result = await self.get(url, verbose=True)
-            await channel_paused # wait until the channel is done
+        # subscribe before sending the request, so the paused event can not be missed
+        with self.bus.subscribe('run', channel_id) as subscription:
+            try:
+                result = await self.get(url, verbose=True)
+            except asyncio.TimeoutError:
+                logger.exception('Received TimeoutError. Something went wrong on the server side? Trying to wait until channel is paused ...')
+                result = None
+            paused = self._wait(channel=channel_id, event='paused', number_of_checks=number_of_checks, subscription=subscription)
+            try:
+                await asyncio.wait_for(paused, timeout) # wait until the channel is done
+            except asyncio.TimeoutError:
+                logger.error(f'channel {channel_id} was not paused within {timeout} s')
+                raise
             return result
-        except asyncio.TimeoutError:
-            logger.exception('Received TimeoutError. Something went wrong on the server side? Trying to wait until channel is paused ...')
-            await channel_paused # wait until the channel is done
-            return
 
         '''
         #save disc space. no more data needed
@@ -513,8 +669,12 @@ class AconitySTUDIO_client:
         try:
             self.job.change_global_parameter(param, value, check_boundaries)
         except AttributeError as e:
+            self.clear_job_cache(self.job_id)
             logger.exception(f'Error:{e}')
             return
+        except BaseException:
+            self.clear_job_cache(self.job_id) # the change may have been made partly, discard the local job
+            raise
         return await self._update_database()
 
     async def change_part_parameter(self, part_id, param, value, laser='*', check_boundaries=True):
@@ -550,10 +710,75 @@ class AconitySTUDIO_client:
         try:
             self.job.change_part_parameter(part_id, param, value, laser, check_boundaries)
         except AttributeError as e:
+            self.clear_job_cache(self.job_id)
             logger.exception(f'Python Client does not know about any job. Please call _get_job():{e}\n')
             return
+        except BaseException:
+            self.clear_job_cache(self.job_id) # the change may have been made partly, discard the local job
+            raise
         return await self._update_database()
 
+    async def change_part_parameters(self, changes, laser='*', check_boundaries=True):
+        '''
+        Change many part parameters in the locally saved job and synchronizes all changes
+        with the Server Database in one request.
+
+        :param changes: {part_id: {param: value}}, for example {4: {'laser_power': 150.0}, 5: {'mark_speed': 900.0}}.
+            For part_id and param see change_part_parameter().
+        :type changes: dict
+
+        :param laser: Used to select the scanner. Either '*' (->"Scanner All") or 1, 2, 3, 4 etc ...
+        :type laser: int
+
+        :param check_boundaries: Ignore min and max values of a parameter.
+        :type check_boundaries: bool
+        '''
+        await self._get_job()
+        try:
+            self.job.change_part_parameters(changes, laser, check_boundaries)
+        except AttributeError as e:
+            self.clear_job_cache(self.job_id)
+            logger.exception(f'Python Client does not know about any job. Please call _get_job():{e}\n')
+            return
+        except BaseException:
+            # some of the changes may have been made locally (ValueError, AssertionError for wrong types, ...)
+            self.clear_job_cache(self.job_id)
+            raise
+        return await self._update_database()
+
+    @contextlib.asynccontextmanager
+    async def edit_job(self):
+        '''
+        Edits the job with many parameter changes and synchronizes them with the
+        Server Database in a single request, e.g. while the job is paused between two layers:
+
+            async with client.edit_job() as job:
+                job.change_global_parameter('supply_factor', 2.0)
+                job.change_part_parameters({4: {'laser_power': 150.0}, 5: {'mark_speed': 900.0}})
+
+        The job is fetched once (see _get_job) and every change is validated when it is made.
+        On exit, the changes are logged and uploaded with one PUT. If nothing was changed, nothing is uploaded.
+        If an exception is raised inside of the block, nothing is uploaded and the local
+        changes are discarded.
+
+        :return: The `JobHandler` of the job (yielded).
+        '''
+        job = await self._get_job()
+        first_change = len(job.changes)
+        try:
+            yield job
+        except BaseException:
+            self.clear_job_cache(self.job_id) # the next _get_job fetches the server copy again
+            raise
+
+        changes = job.changes[first_change:]
+        if not changes:
+            logger.info('edit_job: nothing changed')
+            return
+        diff = '\n'.join(f'\t{target}.{param}: {old} -> {new}' for target, param, old, new in changes)
+        logger.info(f'edit_job: uploading {len(changes)} change(s):\n{diff}')
+        await self._update_database()
+
     async def stop_channel(self, channel='manual_move'):
         '''
         Stops the running execution on the given channel.
@@ -590,17 +815,16 @@ class AconitySTUDIO_client:
                 logger.error(f'Can"t execute new command on channel {channel}. It is already running')
                 return
 
-            #create channel observer
-            channel_done = asyncio.create_task(self._wait(channel=channel, event='halted'))
-            await asyncio.sleep(self.savety_sleep) # give the channel_done task a chance to catch the start
+            #create channel observer before posting, so the start of the command can not be missed
+            with self.bus.subscribe('run', channel) as subscription:
+                response = await self.post(url, data=task)
+                #wait until the channel is done
+                await self._wait(channel=channel, event='halted', subscription=subscription)
+            return response
 
         #post the script
         response = await self.post(url, data=task)
 
-        if self.studio_version == 2:
-            #wait until the channel is done
-            await channel_done
-
         #logger.info(f'execution response: {response}, {response.ok}, {response.text}')
         return response
 
@@ -777,22 +1001,23 @@ class AconitySTUDIO_client:
             logger.exception('no job_id or job?')
             return
 
-        result = await self.put(url = url,
-                                data = job)
+        try:
+            status, response_headers, result = await self._http_request('put', url, data = job, full_response = True)
+        except BaseException:
+            # the server still has the old job, the local one must not be used as its copy
+            self.clear_job_cache(self.job_id)
+            raise
+        # write-through: the server now has the local job, so it can stay cached
+        if status == 200:
+            self._cache_job(self.job_id, self.job, response_headers)
+        else:
+            self.clear_job_cache(self.job_id)
         return result
 
     def _channel_paused(self, msg, channel):
         '''
-        Pauses a channel.
+        Checks if a (decoded) run message reports that the channel was paused.
         '''
-        if msg.type == aiohttp.WSMsgType.CLOSED:
-            logging.warning('->WS CLOSED')
-            return
-        elif msg.type == aiohttp.WSMsgType.ERROR:
-            logging.warning('->WS ERROR')
-            return
-        msg = msg.json()
-
         try:
             if msg['topic'] == 'run' and \
                 msg['data'][0]['msg'] == 'paused' and \
@@ -809,17 +1034,9 @@ class AconitySTUDIO_client:
 
     def _channel_resumed(self, msg, channel):
         '''
-        Resumes a channel.
+        Checks if a (decoded) run message reports that the channel was resumed.
         '''
-        if msg.type == aiohttp.WSMsgType.CLOSED:
-            logging.warning('->WS CLOSED')
-            return
-        elif msg.type == aiohttp.WSMsgType.ERROR:
-            logging.warning('->WS ERROR')
-            return
-        msg = msg.json()
         try:
-            print
             if msg['topic'] == 'run' and \
                 msg['data'][0]['msg'] == 'resumed' and \
                 msg['data'][0]['channel'] == channel:
@@ -835,15 +1052,8 @@ class AconitySTUDIO_client:
 
     def _channel_halted(self, msg, channel):
         '''
-        Halts a channel.
+        Checks if a (decoded) run message reports that the channel stopped, finished or paused.
         '''
-        if msg.type == aiohttp.WSMsgType.CLOSED:
-            logging.warning('->WS CLOSED')
-            return
-        elif msg.type == aiohttp.WSMsgType.ERROR:
-            logging.warning('->WS ERROR')
-            return
-        msg = msg.json()
         try:
             if msg['topic'] == 'run' and \
                 msg['data'][0]['channel'] == channel:
@@ -883,13 +1093,7 @@ class AconitySTUDIO_client:
             'name': name,
             'task': 'register'
         }
-        while True:
-            try:
-                await self._ws.send_json(task)
-                break
-            except AttributeError:
-                logger.debug('websocket connection not (yet) established, cant subscribe to report')
-                await asyncio.sleep(0.01)
+        await self._register(task)
 
         logger.info(f'Subscription to report {name} sent!')
 
@@ -908,116 +1112,467 @@ class AconitySTUDIO_client:
             'name': name,
             'task': 'register'
         }
-        while True:
-            try:
-                await self._ws.send_json(task)
-                break
-            except AttributeError:
-                logger.debug('websocket connection not (yet) established, cant subscribe to topic')
-                await asyncio.sleep(0.01)
+        await self._register(task)
 
         logger.info(f'Subscription to topic {name} sent!')
 
+    async def _register(self, task):
+        '''
+        Sends a registration to the websocket server. Registrations are recorded and sent again after a reconnect.
+        '''
+        key = (task['type'], task['name'])
+        self._registrations[key] = task
+        await self._wait_connected()
+        if key in self._registered: # already sent with the (re)connect
+            return
+        try:
+            await self._ws.send_json(task)
+            self._registered.add(key)
+        except (ConnectionError, RuntimeError) as e: # the connection just closed, the reconnect sends it
+            if not self.ws_reconnect:
+                raise ConnectionError(f'registration {key} failed, the websocket connection is lost') from e
+            logger.warning(f'registration {key} is sent after the reconnect ({e!r})')
+
+    async def _wait_connected(self):
+        '''
+        Waits until the websocket is connected.
+        Raises a ConnectionError if it is down and will not be opened again (ws_reconnect is False or the client is closed).
+        '''
+        if self._ws_connected.is_set():
+            return
+        if self.ws_processing_task is None or self.ws_processing_task.done():
+            raise ConnectionError('the websocket connection is lost and not opened again (login_data["ws_reconnect"])')
+        connected = asyncio.create_task(self._ws_connected.wait())
+        try:
+            await asyncio.wait({connected, self.ws_processing_task}, return_when = asyncio.FIRST_COMPLETED)
+        finally:
+            connected.cancel()
+        if not self._ws_connected.is_set():
+            raise ConnectionError('the websocket connection is lost and not opened again (login_data["ws_reconnect"])')
+
     async def _receive_websocket_data(self):
-        '''Process data received from the websocket'''
+        '''
+        Process data received from the websocket.
+
+        This is the only websocket connection of the client. Every message is published
+        on self.bus, where _wait, _track_AddLayerCommand and other subscribers pick it up.
+
+        If the connection is lost, it is opened again (waiting ws_reconnect_delay seconds, doubled after every
+        failed attempt up to ws_reconnect_max_delay), all reports and topics are registered again
+        and the AddLayerCommand counter is requested from the server (see _reconcile_command_counts).
+        Messages sent while the client was disconnected are lost, the intervals are kept in ws_metrics['gaps'].
+        If the first connection fails, raises the error.
+        '''
+        delay = self.ws_reconnect_delay
+        while True:
+            try:
+                await self._websocket_connection()
+                logger.warning('websocket connection closed')
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.ws_metrics['connects'] == 0:
+                    raise
+                logger.warning(f'websocket connection failed: {e!r}')
+
+            if self._ws_connected.is_set(): # was connected, start a new gap
+                self._ws_connected.clear()
+                self._ws_disconnected_at = (time.time(), time.monotonic())
+                delay = self.ws_reconnect_delay
+            if not self.ws_reconnect:
+                logger.error('websocket connection lost, reconnecting is disabled (login_data["ws_reconnect"])')
+                return
+            logger.info(f'reconnecting websocket in {delay:.1f} s')
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, self.ws_reconnect_max_delay)
+
+    async def _websocket_connection(self):
+        '''
+        One websocket connection: registers all reports and topics, then processes the messages until it is closed.
+        '''
         ws_url = self.ws_url + '/connect'
-        async with aiohttp.ClientSession(headers=self._headers) as session:
-            async with session.ws_connect(ws_url) as self._ws:
-                async for msg in self._ws:
-                    if msg.type == aiohttp.WSMsgType.CLOSED:
-                        logging.warning('->WS CLOSED')
-                        return
-                    elif msg.type == aiohttp.WSMsgType.ERROR:
-                        logging.warning('->WS ERROR')
-                        return
-
-                    msg = msg.json()
-
-                    for processor in self.processors:
+        async with self._open_session().ws_connect(ws_url, headers=self._headers) as self._ws:
+            self._registered = set()
+            for key, task in list(self._registrations.items()):
+                await self._ws.send_json(task)
+                self._registered.add(key)
+            self.ws_metrics['connects'] += 1
+            self._ws_connected.set()
+            if self._ws_disconnected_at is None:
+                logger.info('websocket connection established')
+            else:
+                self._record_gap()
+                self._tasks.append(asyncio.create_task(self._reconcile_command_counts()))
+
+            async for msg in self._ws:
+                if msg.type == aiohttp.WSMsgType.CLOSED:
+                    logging.warning('->WS CLOSED')
+                    return
+                elif msg.type == aiohttp.WSMsgType.ERROR:
+                    logging.warning('->WS ERROR')
+                    return
+
+                self.ws_stats['received'] += 1
+                topic = utils.peek_topic(msg.data)
+                if topic is not None and not self._wants_topic(topic):
+                    self.ws_stats['skipped'] += 1
+                    continue
+                try:
+                    msg = utils.decode_ws_msg(msg.data)
+                except ValueError:
+                    logger.exception(f'could not parse websocket message {msg.data[:100]}')
+                    continue
+                if topic is None and isinstance(msg, dict): # the topic was not the first key, filter after parsing
+                    topic = msg.get('topic')
+                    if topic is not None and not self._wants_topic(topic):
+                        self.ws_stats['skipped'] += 1
+                        continue
+
+                self.bus.publish(msg)
+                if topic is None or self.telemetry_store.records(topic):
+                    self.telemetry_store.record(msg)
+
+                for processor in list(self.processors):
+                    runner = self._processor_runner(processor)
+                    if not runner.wants(msg.get('topic')):
+                        continue
+                    if runner.policy == 'inline':
                         await asyncio.sleep(0)
-                        #print(f'\nCLIENT:starting processor {processor}')
-                        try:
-                            processor(self, msg)
-                        except Exception:
-                            logger.exception(f'processing ({processor}) ws msg raised an exception.\n')
-                        # loop = asyncio.get_running_loop()
-                        # await loop.run_in_executor(None, processor, msg_new)
-
-
-                    if self.pymongo_database: #call client.enable_pymongo_database to activate this feature
-                        msg['_timestamp_db'] = time.time()
-                        post_id = self._db.insert_one(msg).inserted_id
-                        if self.keep_last > 0:
-                            delete_time = time.time() - self.keep_last
-                            self._db.remove({'_timestamp_db':{'$lt': delete_time}})
+                    runner.submit(self, msg)
+
+
+                if self.pymongo_database: #call client.enable_pymongo_database to activate this feature
+                    self._db_sink.put(msg) # written in batches by a background task
+
+    def _record_gap(self):
+        ''' Updates ws_metrics after a reconnect '''
+        disconnected_time, disconnected_monotonic = self._ws_disconnected_at
+        self._ws_disconnected_at = None
+        duration = time.monotonic() - disconnected_monotonic
+        self.ws_metrics['reconnects'] += 1
+        self.ws_metrics['disconnected_s'] += duration
+        self.ws_metrics['last_reconnect_s'] = duration
+        self.ws_metrics['max_reconnect_s'] = max(self.ws_metrics['max_reconnect_s'], duration)
+        self.ws_metrics['gaps'].append((disconnected_time, disconnected_time + duration))
+        logger.warning(f'websocket reconnected after {duration:.2f} s, messages of this interval are lost')
+
+    async def _reconcile_command_counts(self):
+        '''
+        After a reconnect, requests the command counts of the running script from the server
+        and publishes them as cmds report, so the AddLayerCommand counter (and everybody waiting for it)
+        catches up with the layers finished while the client was disconnected.
+        '''
+        try:
+            counts = utils.find_command_counts(await self.get('script'))
+        except Exception:
+            logger.exception('could not request the command counts after the reconnect')
+            counts = None
+        if counts is None:
+            logger.warning(f'could not reconcile the AddLayerCommand counter after the reconnect, '\
+                           f'it may be too low (last value {self.job_info["AddLayerCommands"]})')
+            return
+        logger.info(f'command counts after the reconnect: {counts}')
+        self.bus.publish({'topic': 'cmds', 'data': [{'name': 'report', 'value': json.dumps({'counts': counts})}]})
+
+    def _wants_topic(self, topic):
+        '''
+        Returns True if anybody uses messages of the topic: subscribers of self.bus, processors,
+        the telemetry store or the database. Other messages are not parsed at all.
+        '''
+        if self.pymongo_database or self.bus.has_subscribers(topic) or self.telemetry_store.records(topic):
+            return True
+        return any(self._processor_runner(processor).wants(topic) for processor in self.processors)
+
+    def add_processor(self, processor, topics=None, policy='inline', maxsize=1000, overflow='drop_oldest'):
+        '''
+        Adds a function `processor(client, msg)` which is called for every websocket message.
+
+        :param topics: only call the processor for messages of these topics (e.g. ['cmds']). None for all messages.
+            Messages of topics nobody uses are not even parsed, so restricting processors
+            to the topics they need saves CPU with high rate topics like 'Sensor'.
+        :type topics: list
+
+        :param policy: where the processor runs (see AconitySTUDIO_events.ProcessorRunner):
+            'inline' (in the receive loop, it waits for the processor), 'task' (asyncio task, coroutine functions allowed),
+            'thread' (thread pool) or 'process' (process pool, called as `processor(msg)`).
+        :type policy: string
+
+        :param maxsize: maximum number of messages waiting for the processor (not for 'inline')
+        :type maxsize: int
+
+        :param overflow: if more messages wait: 'drop_oldest', 'drop_newest' or 'coalesce' (keep the newest message per topic)
+        :type overflow: string
+        '''
+        executor = None
+        if policy == 'thread':
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(thread_name_prefix='processor')
+            executor = self._thread_pool
+        elif policy == 'process':
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor()
+            executor = self._process_pool
+        runner = events.ProcessorRunner(processor, topics, policy, maxsize, overflow, executor)
+        self.processors.append(processor)
+        self._processor_runners[processor] = runner
+        logger.info(f'added processor {runner.name} ({policy}, topics: {topics or "all"})')
+
+    def remove_processor(self, processor):
+        ''' Removes a processor added with add_processor. Messages waiting for it are discarded. '''
+        if processor in self.processors:
+            self.processors.remove(processor)
+        runner = self._processor_runners.pop(processor, None)
+        if runner is not None:
+            runner.stop()
+
+    def _processor_runner(self, processor):
+        ''' Runner of a processor, processors appended to self.processors directly run inline for all topics '''
+        runner = self._processor_runners.get(processor)
+        if runner is None:
+            runner = self._processor_runners[processor] = events.ProcessorRunner(processor)
+        return runner
+
+    def processor_stats(self):
+        '''
+        Returns the statistics of every processor: processed, dropped and failed messages,
+        current and maximum number of waiting messages.
+
+        :rtype: dict
+        '''
+        return {self._processor_runner(processor).name: self._processor_runner(processor).stats()
+                for processor in self.processors}
 
     async def _track_AddLayerCommand(self):
-        '''websocket connection used internally to listen to the number of finished AddLayerCommands'''
-        ws_url = self.ws_url + '/connect'
+        '''subscriber used internally to listen to the number of finished AddLayerCommands'''
+        with self.bus.subscribe('cmds') as subscription:
+            try:
+                async for msg in subscription:
+                    counts = utils.get_command_counts(msg)
+                    if counts is not None and 'AddLayerCommand' in counts:
+                        self.job_info['AddLayerCommands'] = counts['AddLayerCommand']
+            except asyncio.CancelledError:
+                logger.info('received cancellation')
+                raise
 
-        async with aiohttp.ClientSession(headers=self._headers) as session:
-            async with session.ws_connect(ws_url) as ws:
-                try:
-                    task = {
-                        'type': 'cmds',
-                        'name': 'cmds',
-                        'task': 'register'
-                    }
-                    await ws.send_json(task)
-
-                    async for msg in ws:
-                        if msg.type == aiohttp.WSMsgType.CLOSED:
-                            print('->WS CLOSED')
-                            return
-                        elif msg.type == aiohttp.WSMsgType.ERROR:
-                            print('->WS ERROR')
-                            return
-                        msg = msg.json()
-                        if 'topic' in msg and msg['topic'] == 'cmds' and 'data' in msg:
-                            for data in msg['data']:
-                                if 'name' in data and 'value' in data and data['name'] == 'report':
-                                    value = json.loads(data['value'])
-                                    if 'counts' in value and 'AddLayerCommand' in value['counts']:
-                                        AddLayerCommand = value['counts']['AddLayerCommand']
-                                        self.job_info['AddLayerCommands'] = AddLayerCommand
-                except asyncio.CancelledError:
-                    logger.info('received cancellation')
-                    await ws.close()
-
-    async def _wait(self, channel, event, number_of_checks = 1):
-        '''websocket connection used internally to listen on the run report to see when a channel finished its work'''
-        ws_url = self.ws_url + '/connect'
-        #print(f'WS: start observing {channel}')
-        async with aiohttp.ClientSession(headers=self._headers) as session:
-            #print(f'WS: created client session {channel}')
-            async with session.ws_connect(ws_url) as ws:
-                #print(f'WS: created ws session {channel}')
-                task = {
-                    'type': 'run',
-                    'name': 'run',
-                    'task': 'register'
-                }
-                await ws.send_json(task)
-                #print(f'WS: created run report {channel}')
-                #print('->checking if channel starts')
-                if event == 'halted':
-                    async for msg in ws:
-                        if self._channel_resumed(msg, channel):
-                            break
-                    #print(f'WS: channel resumed {channel}')
-                    #print('->checking if channel halted')
-                    async for msg in ws:
-                        if self._channel_halted(msg, channel):
-                            break
-                    #print(f'WS: channel halted {channel}')
-                    #print('-> apparently channel halted')
-                elif event == 'paused':
-                    for check in range(1, number_of_checks + 1):
-                        logger.info(f'pause check #{check}')
-                        async for msg in ws:
-                            if self._channel_paused(msg, channel):
-                                break
-                #await ws.close() # hopefully never neccessary
+    def telemetry(self, topic, signal, last=None, start=None, end=None, max_points=None):
+        '''
+        Returns the recent history of a numeric signal of the websocket messages,
+        for example the slider position of the last 30 seconds::
+
+            timestamps, positions = client.telemetry('Positioning', 'slider', last=30)
+
+        Only topics the client subscribed to (see subscribe_topic) and listed in
+        `telemetry_topics` (login_data, default ['Positioning']) are recorded.
+        For every signal the last `telemetry_capacity` samples (login_data, default 10000) are kept.
+
+        :param topic: topic of the messages, for example 'Positioning' or 'Sensor'.
+        :type topic: string
+
+        :param signal: 'cid' (or 'name') of the value in the message data, for example 'slider'.
+        :type signal: string
+
+        :param last: only the samples of the last `last` seconds.
+        :type last: float
+
+        :param start: unix time of the first sample.
+        :type start: float
+
+        :param end: unix time of the last sample.
+        :type end: float
+
+        :param max_points: return at most max_points samples (every n-th sample).
+        :type max_points: int
+
+        :return: (timestamps, values), unix times and values as numpy arrays (array.array without numpy)
+        :rtype: tuple
+        '''
+        return self.telemetry_store.query(topic, signal, last=last, start=start, end=end, max_points=max_points)
+
+    async def _wait(self, channel, event, number_of_checks = 1, subscription = None):
+        '''
+        Used internally to listen on the run report to see when a channel finished its work.
+
+        To avoid missing events, pass a `subscription` to the run topic which was
+        created before the request triggering the event was sent.
+        '''
+        if subscription is None:
+            with self.bus.subscribe('run', channel) as subscription:
+                return await self._wait(channel, event, number_of_checks, subscription)
+
+        #print('->checking if channel starts')
+        if event == 'halted':
+            async for msg in subscription:
+                if self._channel_resumed(msg, channel):
+                    break
+            #print(f'WS: channel resumed {channel}')
+            #print('->checking if channel halted')
+            async for msg in subscription:
+                if self._channel_halted(msg, channel):
+                    break
+            #print(f'WS: channel halted {channel}')
+        elif event == 'paused':
+            for check in range(1, number_of_checks + 1):
+                logger.info(f'pause check #{check}')
+                async for msg in subscription:
+                    if self._channel_paused(msg, channel):
+                        break
+
+    #######################
+    # WAIT FOR CONDITIONS #
+    #######################
+    async def _wait_for_condition(self, topic, condition, timeout=None, channel=None, subscription=None, description=''):
+        '''
+        Waits until `condition(msg)` returns True for a message of the given topic.
+        If `condition(None)` is already True, returns immediately.
+
+        Raises an asyncio.TimeoutError if the condition is not fulfilled within `timeout` seconds.
+        '''
+        async def wait(subscription):
+            if condition(None):
+                return
+            async for msg in subscription:
+                if condition(msg):
+                    return
+
+        t_start = time.time()
+        try:
+            if subscription is None:
+                with self.bus.subscribe(topic, channel) as subscription:
+                    await asyncio.wait_for(wait(subscription), timeout)
+            else:
+                await asyncio.wait_for(wait(subscription), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f'timeout ({timeout} s) while waiting for {description}')
+            raise
+        logger.info(f'{description} after {time.time() - t_start:.2f} s')
+
+    async def _track_positions(self):
+        '''subscriber used internally to keep self.positions up to date'''
+        with self.bus.subscribe('Positioning') as subscription:
+            async for msg in subscription:
+                self.positions.update(utils.get_positions(msg))
+
+    async def _ensure_position_tracking(self):
+        '''Subscribes to the Positioning topic and keeps self.positions up to date (called by create)'''
+        if self._position_tracking is None:
+            self._position_tracking = asyncio.create_task(self._track_positions())
+            self._tasks.append(self._position_tracking)
+            await self.subscribe_topic('Positioning')
+
+    async def wait_for_position(self, axis, position, tolerance=0.05, timeout=60):
+        '''
+        Waits until an axis reached a position, using the Positioning topic.
+
+        :param axis: name of the axis component, for example 'slider' or 'platform'.
+        :type axis: string
+
+        :param position: target position of the axis.
+        :type position: float
+
+        :param tolerance: the position counts as reached if it deviates less than tolerance.
+        :type tolerance: float
+
+        :param timeout: maximum time to wait in seconds. If exceeded, raises an asyncio.TimeoutError.
+        :type timeout: float
+        '''
+        await self._ensure_position_tracking()
+        position = float(position)
+
+        def reached(msg):
+            if msg is None:
+                current = self.positions.get(axis)
+            else:
+                current = utils.get_positions(msg).get(axis)
+            return current is not None and abs(current - position) <= tolerance
+
+        await self._wait_for_condition('Positioning', reached, timeout,
+                                       description=f'{axis} reached position {position}')
+        return position
+
+    async def wait_for_motion(self, axis, position, threshold=0.05, timeout=60):
+        '''
+        Waits until an axis starts moving away from a position, using the Positioning topic.
+
+        :param axis: name of the axis component, for example 'slider'.
+        :type axis: string
+
+        :param position: position of the axis before the move.
+        :type position: float
+
+        :param threshold: the axis counts as moving once it deviates more than threshold from position.
+        :type threshold: float
+
+        :param timeout: maximum time to wait in seconds. If exceeded, raises an asyncio.TimeoutError.
+        :type timeout: float
+
+        :return: time.perf_counter() when the motion was detected
+        :rtype: float
+        '''
+        await self._ensure_position_tracking()
+        position = float(position)
+
+        def moving(msg):
+            current = None if msg is None else utils.get_positions(msg).get(axis)
+            return current is not None and abs(current - position) > threshold
+
+        await self._wait_for_condition('Positioning', moving, timeout,
+                                       description=f'{axis} started moving from {position}')
+        return time.perf_counter()
+
+    async def wait_for_channel(self, channel, events=('stopped', 'finished', 'paused'), timeout=None, subscription=None):
+        '''
+        Waits until the run report announces one of the given events on a channel.
+
+        To not miss an event caused by a request, create the subscription before sending the request::
+
+            with client.bus.subscribe('run', 'run0') as subscription:
+                await client.resume_job()
+                await client.wait_for_channel('run0', ('resumed',), subscription=subscription)
+
+        :param channel: Example: 'run0', 'manual_move'.
+        :type channel: string
+
+        :param events: run report messages to wait for. The default waits until the channel halted.
+        :type events: tuple
+
+        :param timeout: maximum time to wait in seconds. If exceeded, raises an asyncio.TimeoutError.
+        :type timeout: float
+        '''
+        def happened(msg):
+            try:
+                return msg is not None and msg['data'][0]['msg'] in events
+            except (KeyError, IndexError, TypeError):
+                return False
+
+        await self._wait_for_condition('run', happened, timeout, channel=channel, subscription=subscription,
+                                       description=f'channel {channel} reported one of {events}')
+
+    async def wait_for_paused(self, channel='run0', timeout=None, subscription=None):
+        '''
+        Waits until a job is paused on the given channel. See wait_for_channel.
+        '''
+        await self.wait_for_channel(channel, ('paused',), timeout, subscription)
+
+    async def wait_for_layer(self, count, timeout=None):
+        '''
+        Waits until the AddLayerCommand counter of the running job reached `count`.
+
+        :param count: number of AddLayerCommands. Compare self.job_info['AddLayerCommands'].
+        :type count: int
+
+        :param timeout: maximum time to wait in seconds. If exceeded, raises an asyncio.TimeoutError.
+        :type timeout: float
+        '''
+        def advanced(msg):
+            if msg is None:
+                current = self.job_info['AddLayerCommands']
+            else:
+                counts = utils.get_command_counts(msg)
+                current = None if counts is None else counts.get('AddLayerCommand')
+            return current is not None and current >= count
+
+        await self._wait_for_condition('cmds', advanced, timeout,
+                                       description=f'AddLayerCommand counter reached {count}')
 
     #######################################
     # MACHINE INFORMATION AND SERVER DATA #
@@ -1040,6 +1595,127 @@ class AconitySTUDIO_client:
         logger.info(f'self.session_id: {self.session_id}')
         return self.session_id
 
+    def _load_id_cache(self):
+        '''
+        Loads the ids saved for this server (self.rest_url) from self.id_cache_file.
+        A missing or unreadable file gives an empty cache.
+        '''
+        id_cache = {'jobs': {}, 'machines': {}, 'configurations': {}}
+        if self.id_cache_file is None or not os.path.exists(self.id_cache_file):
+            return id_cache
+        try:
+            with open(self.id_cache_file) as file:
+                saved = json.load(file).get(self.rest_url, {})
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning(f'could not read the id cache {self.id_cache_file}: {e}')
+            return id_cache
+        for kind in id_cache:
+            id_cache[kind].update(saved.get(kind, {}))
+        return id_cache
+
+    def _save_id_cache(self):
+        '''
+        Saves self.id_cache to self.id_cache_file. Ids of other servers in the file are kept.
+        '''
+        if self.id_cache_file is None:
+            return
+        try:
+            with open(self.id_cache_file) as file:
+                servers = json.load(file)
+        except (OSError, ValueError):
+            servers = {}
+        servers[self.rest_url] = self.id_cache
+        try:
+            tmp_file = f'{self.id_cache_file}.tmp'
+            with open(tmp_file, 'w') as file:
+                json.dump(servers, file, indent=3)
+            os.replace(tmp_file, self.id_cache_file)
+        except OSError as e:
+            logger.warning(f'could not save the id cache {self.id_cache_file}: {e}')
+
+    def _remember_id(self, kind, name, entity_id):
+        '''
+        Saves the id of a uniquely named job, machine or configuration in the id cache.
+        '''
+        self._ids_validated.add((kind, name))
+        if self.id_cache[kind].get(name) != entity_id:
+            self.id_cache[kind][name] = entity_id
+            self._save_id_cache()
+
+    def _forget_id(self, kind, name):
+        '''
+        Removes an id, which does not match the server anymore, from the id cache.
+        '''
+        self._ids_validated.discard((kind, name))
+        if self.id_cache[kind].pop(name, None) is not None:
+            self._save_id_cache()
+
+    async def _get_entity(self, kind, entity_id):
+        '''
+        Returns a single job, machine or configuration ('{kind}/{entity_id}'), or None if the server does not have it.
+        '''
+        try:
+            status, response_headers, entity = await self._http_request('get', f'{kind}/{entity_id}', log_level='debug',
+                                                                         full_response=True)
+        except aiohttp.ClientResponseError as e: # the session raises for 4xx/5xx answers
+            logger.debug(f'{kind}/{entity_id} not available: {e.status}')
+            return None
+        if status != 200 or not isinstance(entity, dict):
+            return None
+        if kind == 'jobs': # the job is needed next anyway, don't download it twice
+            self._cache_job(entity_id, utils.JobHandler(entity, logger, self.studio_version), response_headers)
+        return entity
+
+    async def _resolve(self, kind, name, need_entity=False):
+        '''
+        Returns the candidates for a job, machine or configuration name as a list of entities
+        (dicts with at least 'name' and '_id').
+
+        If the id of the name is in the id cache, only this entity is requested from the server
+        instead of the whole collection. The first use of a cached id in a session checks that the entity
+        still exists and has this name; if not, the id is removed from the cache.
+        After that, the id is used without a request, unless `need_entity` is set.
+        Without a cached id, returns the whole collection.
+
+        :param kind: 'jobs', 'machines' or 'configurations'
+        :type kind: string
+
+        :param need_entity: the caller needs the current entity from the server (e.g. the state of a config)
+        :type need_entity: bool
+
+        :rtype: list
+        '''
+        entity_id = self.id_cache[kind].get(name)
+        if entity_id is not None:
+            if (kind, name) in self._ids_validated and not need_entity:
+                logger.debug(f'using cached id {entity_id} of {kind} "{name}"')
+                return [{'name': name, '_id': {'$oid': entity_id}}]
+            entity = await self._get_entity(kind, entity_id)
+            if entity is not None and entity.get('name') == name:
+                logger.debug(f'cached id {entity_id} of {kind} "{name}" is valid')
+                self._ids_validated.add((kind, name))
+                return [entity]
+            logger.info(f'cached id {entity_id} of {kind} "{name}" is outdated')
+            self._forget_id(kind, name)
+        return await self.get(kind)
+
+    async def resolve_ids(self, job_name=None, machine_name=None, config_name=None):
+        '''
+        Looks up job_id, machine_id and config_id at the same time (see get_job_id, get_machine_id, get_config_id).
+        Names that are None are skipped.
+
+        :return: job_id, machine_id, config_id
+        :rtype: tuple
+        '''
+        async def skip():
+            return None
+
+        return tuple(await asyncio.gather(
+            self.get_job_id(job_name) if job_name is not None else skip(),
+            self.get_machine_id(machine_name) if machine_name is not None else skip(),
+            self.get_config_id(config_name) if config_name is not None else skip(),
+        ))
+
     async def get_machine_id(self, machine_name):
         '''
         Get the machine_id from a given Machine Name.
@@ -1048,6 +1724,7 @@ class AconitySTUDIO_client:
         In this case, start the Browser based GUI AconitySTUDIO and copy the id from the URL and manually set the attribute machine_id.
 
         If successfull, returns the machine_id and saves it to self.machine_id.
+        The id is kept in the id cache, see _resolve().
 
         :param machine_name: Name of Machine
         :type machine_name: string
@@ -1055,7 +1732,7 @@ class AconitySTUDIO_client:
         :return: Machine ID
         :rtype: string
         '''
-        result = await self.get('machines')
+        result = await self._resolve('machines', machine_name)
 
         cnt = 0
         for machine in result:
@@ -1070,6 +1747,7 @@ class AconitySTUDIO_client:
             logger.error('More than one machine with the same name found! Please set the machine_id attribute manually. (start GUI AconitySTUDIO -> copy from URL)')
             raise ValueError('More than one machine with the same name found! Please set the machine_id attribute manually. (start GUI AconitySTUDIO -> copy from URL)')
         else:
+            self._remember_id('machines', machine_name, self.machine_id)
             logger.info(f'self.machine_id: {self.machine_id}')
             logger.info(f'self.machine_name: {self.machine_name}')
             return self.machine_id
@@ -1129,13 +1807,15 @@ class AconitySTUDIO_client:
         If it is not unique or no job with the given name is found, raises a ValueError.
         In this case, start the Browser based GUI AconitySTUDIO and copy the id from the URL and manually set the attribute machine_id.
 
+        The id is kept in the id cache, see _resolve().
+
         :param job_name: jobname
         :type job_name: string
 
         :return: Job ID
         :rtype: string
         '''
-        jobs = await self.get('jobs')
+        jobs = await self._resolve('jobs', job_name)
         cnt = 0
         for job in jobs:
             if job['name'] == job_name:
@@ -1149,17 +1829,84 @@ class AconitySTUDIO_client:
             logger.error(f'More than one job with the name {job_name} found! Please set the job_id attribute manually (start GUI AconitySTUDIO -> copy from URL)')
             raise ValueError(f'More than one job with the name {job_name} found! Please set the job_id attribute manually (start GUI AconitySTUDIO -> copy from URL)')
         else:
+            self._remember_id('jobs', job_name, self.job_id)
             logger.info(f'self.job_name: {self.job_name}')
             logger.info(f'self.job_id: {self.job_id}')
             return self.job_id
 
-    async def _get_job(self, job_id=None):
-        ''' Returns the `JobHandler` object for the current job.'''
+    async def _get_job(self, job_id=None, refresh=False):
+        '''
+        Returns the `JobHandler` object for the current job.
+
+        Jobs are cached by their id. If the server sent an ETag or Last-Modified header
+        with the job, the cached job is revalidated with a conditional GET and only downloaded
+        again if it changed on the server. Without these headers, the cached job is used
+        for job_cache_ttl seconds. A downloaded job equal to the cached one keeps the cached
+        `JobHandler`, so its rendered scripts are not built again.
+
+        :param refresh: ignore the cache and download the job.
+        :type refresh: bool
+        '''
         job_id = utils._gather(self, logger, 'job_id', job_id)
-        job = await self.get(f'jobs/{job_id}')
-        self.job = utils.JobHandler(job, logger, self.studio_version)
+        entry = None if refresh else self.job_cache.get(job_id)
+        headers = dict(self._headers)
+        if entry is not None:
+            if entry['etag'] is None and entry['last_modified'] is None:
+                if time.monotonic() - entry['fetched'] < self.job_cache_ttl:
+                    logger.debug(f'using cached job {job_id}')
+                    self.job = entry['job']
+                    return self.job
+            else:
+                if entry['etag'] is not None:
+                    headers['If-None-Match'] = entry['etag']
+                if entry['last_modified'] is not None:
+                    headers['If-Modified-Since'] = entry['last_modified']
+
+        status, response_headers, job = await self._http_request('get', f'jobs/{job_id}', log_level='debug',
+                                                                 headers=headers, full_response=True)
+        if status == 304 and entry is not None:
+            logger.debug(f'job {job_id} not modified, using cached job')
+            entry['fetched'] = time.monotonic()
+            self.job = entry['job']
+            return self.job
+
+        cached = self.job_cache.get(job_id)
+        if status == 200 and cached is not None and cached['job'].job == job:
+            # unchanged (the server sent no validators or the ttl expired): keep the handler and its rendered scripts
+            logger.debug(f'job {job_id} unchanged, using cached job')
+            self.job = cached['job']
+        else:
+            self.job = utils.JobHandler(job, logger, self.studio_version)
+        if status == 200:
+            self._cache_job(job_id, self.job, response_headers)
+        else:
+            self.job_cache.pop(job_id, None)
         return self.job
 
+    def _cache_job(self, job_id, job, response_headers):
+        '''
+        Saves a job, which is known to match the server copy, in the job cache.
+        '''
+        self.job_cache[job_id] = {
+            'job': job,
+            'etag': response_headers.get('ETag'),
+            'last_modified': response_headers.get('Last-Modified'),
+            'fetched': time.monotonic(),
+        }
+
+    def clear_job_cache(self, job_id=None):
+        '''
+        Removes a job (or all jobs if job_id is None) from the job cache,
+        e.g. after the job was edited in the GUI.
+
+        :param job_id: id of the job
+        :type job_id: string
+        '''
+        if job_id is None:
+            self.job_cache.clear()
+        else:
+            self.job_cache.pop(job_id, None)
+
     async def get_config_id(self, config_name):
         '''
         Returns the config_id of the config with the given name.
@@ -1169,11 +1916,12 @@ class AconitySTUDIO_client:
 
         Saves the config_id into self.config_id.
         Saves the name of the operational config into self.config_name.
+        The id is kept in the id cache, see _resolve(). The state of the config is always requested from the server.
 
         :return: Config ID
         :rtype: string
         '''
-        configs = await self.get('configurations')
+        configs = await self._resolve('configurations', config_name, need_entity=True)
 
         cnt = 0
         for config in configs:
@@ -1195,6 +1943,7 @@ class AconitySTUDIO_client:
             logger.error(f'More than one config with the name {config_name} found! Please set the config_id attribute manually (start GUI AconitySTUDIO -> copy from URL)')
             raise ValueError(f'More than one config with the name {config_name} found! Please set the config_id attribute manually (start GUI AconitySTUDIO -> copy from URL')
         else:
+            self._remember_id('configurations', config_name, self.config_id)
             logger.info(f'self.config_name: {self.config_name}\t({config_state})')
             logger.info(f'self.config_id: {self.config_id}')
             if not self.config_operational:
@@ -1253,14 +2002,15 @@ class AconitySTUDIO_client:
             logger.warning('please provide a config_name XOR config_id')
             raise ValueError('please provide a config_name XOR config_id')
 
-        configs = await self.get('configurations')
-        for config in configs:
-            if config['name'] == config_name:
-                logger.info(f'configuration {config_name} exists')
-                return True
-            if config['_id']['$oid'] == config_id:
+        if config_id != None:
+            if (await self._get_entity('configurations', config_id)) is not None:
                 logger.info(f'configuration with config id {config_id} exists')
                 return True
+        else:
+            for config in await self._resolve('configurations', config_name):
+                if config['name'] == config_name:
+                    logger.info(f'configuration {config_name} exists')
+                    return True
         logging.warning(f'no configuration with the given name/config_id could be found!')
         return False
 
@@ -1276,13 +2026,11 @@ class AconitySTUDIO_client:
         '''
         config_id = utils._gather(self, logger, 'config_id', config_id)
 
-        configurations = await self.get('configurations')
+        config = await self._get_entity('configurations', config_id)
+        if config is not None:
+            return config['state']
 
-        for config in configurations:
-            if config['_id']['$oid'] == self.config_id: #use clients own attribute self.config_id
-                return config['state']
-
-        raise ValueError('cant check state of config. config with config_id {config_id} can not be found!')
+        raise ValueError(f'cant check state of config. config with config_id {config_id} can not be found!')
 
     async def get_lasers_off_cmds(self):
         ''' Returns the command to turn the laser off.'''
@@ -1335,15 +2083,28 @@ class AconitySTUDIO_client:
     # PYTHON CLIENT'S OWN DATABASE #
     ################################
 
-    def enable_pymongo_database(self, name='database_test', keep_last = 120):
+    def enable_pymongo_database(self, name='database_test', keep_last = 120, batch_size = 500, flush_interval = 0.5,
+                                max_queue = 10000):
         '''
-        Setup for the Mongodatabase
+        Setup for the Mongodatabase. From now on, every websocket message is saved in the collection `posts`.
+
+        The messages are written in batches by a background task (see AconitySTUDIO_database.MongoSink),
+        the websocket processing never waits for the database.
 
         :param mongodatabase: name of the database
         :type mongodatabase: string
 
-        :param keep_last: If larger that zero, automatically delete entries older than keep_last seconds
+        :param keep_last: If larger that zero, automatically delete entries older than keep_last seconds (TTL index)
         :type keep_last: float
+
+        :param batch_size: maximum number of messages written at once
+        :type batch_size: int
+
+        :param flush_interval: maximum time in seconds a message waits for its batch
+        :type flush_interval: float
+
+        :param max_queue: maximum number of messages waiting for the database. If more arrive, the oldest are dropped.
+        :type max_queue: int
         '''
         try:
             mongoclient = MongoClient()
@@ -1354,6 +2115,8 @@ class AconitySTUDIO_client:
             return
 
         self.keep_last = keep_last
+        self._db_sink = database.MongoSink(self._db, keep_last = keep_last, batch_size = batch_size,
+                                           flush_interval = flush_interval, max_queue = max_queue)
         self.pymongo_database = True
         logger.info(f'connected to mongo database {name}')
 
@@ -1362,19 +2125,17 @@ class AconitySTUDIO_client:
         Continually saves the output of the WebSocket Server
         by saving it into a Mongo database
         Call enable_pymongo_database() before calling this function
+
+        The websocket messages are saved by the client itself once the database is enabled.
+        This function only waits until the client is closed and logs the state of the database writer every minute.
         '''
 
         if self.pymongo_database == False:
             logger.error('No database configured. Call enable_pymongo_database')
             return
-        while True:
-            msg = await self._ws.recv()
-            msg = utils.fix_ws_msg(msg)
-            msg_json = json.loads(msg)
-            logger.info(f'received data from websocket:'\
-                         f'{str(msg_json)[:30]}...')
-            msg_json['_timestamp_db'] = time.time()
-            post_id = self._db.insert_one(msg_json).inserted_id
-            if self.keep_last > 0:
-                delete_time = time.time() - self.keep_last
-                self._db.remove({'_timestamp_db':{'$lt': delete_time}})
+        while self._db_sink is not None and not self._db_sink.closed:
+            await asyncio.sleep(60)
+            logger.info(f'database: {self._db_sink.stats()}')
+
+# name under which the client is imported by the PILM scripts
+AconitySTUDIOPythonClient = AconitySTUDIO_client
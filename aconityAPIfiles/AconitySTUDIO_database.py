@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__package__)
+
+class MongoSink:
+    '''
+    Writes websocket messages to a (pymongo) collection without blocking the event loop.
+
+    `put` only appends the message to a bounded queue. A background task collects the messages
+    into batches of up to `batch_size` messages (or whatever arrived within `flush_interval` seconds)
+    and writes every batch with one `insert_many` in a worker thread.
+    If the database can not keep up and more than `max_queue` messages are waiting, the oldest ones are dropped.
+
+    Every stored document gets the fields `_timestamp_db` (unix time, as before) and `_created_db` (date).
+    If `keep_last > 0`, MongoDB deletes documents older than `keep_last` seconds itself,
+    using a TTL index on `_created_db` (TTL indexes only work on date fields) which is created once.
+
+    Usage::
+
+        sink = MongoSink(MongoClient().database_test.posts, keep_last=120)
+        sink.put(msg)
+        ...
+        await sink.close() # writes the remaining messages
+    '''
+    def __init__(self, collection, keep_last=120, batch_size=500, flush_interval=0.5, max_queue=10000):
+        self.collection = collection
+        self.keep_last = keep_last
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # statistics
+        self.inserted = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_delay = 0.0 # longest time in s a message waited before it was written
+
+        self._queue = asyncio.Queue(max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='MongoSink') # one writer keeps the order
+        self._task = None
+        self._stopping = False
+
+    def start(self):
+        ''' Starts the background writer. Called by the first `put`, needs a running event loop. '''
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def put(self, msg):
+        '''
+        Queues a message for the database. Never blocks.
+
+        The message itself is not modified, the database gets a copy.
+        '''
+        if self._stopping:
+            self.dropped += 1
+            return
+        self.start()
+        now = time.time()
+        document = dict(msg)
+        document['_timestamp_db'] = now
+        document['_created_db'] = datetime.fromtimestamp(now, timezone.utc)
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f'database queue is full, dropped {self.dropped} message(s)')
+        self._queue.put_nowait(document)
+
+    def _create_ttl_index(self):
+        if self.keep_last > 0:
+            self.collection.create_index('_created_db', expireAfterSeconds=int(self.keep_last))
+
+    def _insert(self, batch):
+        self.collection.insert_many(batch, ordered=False)
+
+    async def _next_batch(self):
+        ''' Collects messages until the batch is full or flush_interval has passed since the first one. '''
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            if self._queue.empty():
+                if self._stopping:
+                    break
+                timeout = self.flush_interval if deadline is None else deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    if batch:
+                        break
+                    continue
+            else:
+                batch.append(self._queue.get_nowait())
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return batch
+
+    async def _write(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._insert, batch)
+        except Exception:
+            self.failed += len(batch)
+            logger.exception(f'writing {len(batch)} message(s) to the database failed')
+            return
+        self.inserted += len(batch)
+        self.batches += 1
+        self.max_delay = max(self.max_delay, time.time() - batch[0]['_timestamp_db'])
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._create_ttl_index)
+        except Exception:
+            logger.exception('creating the TTL index of the database failed, old messages are not deleted')
+        while not (self._stopping and self._queue.empty()):
+            batch = await self._next_batch()
+            if batch:
+                await self._write(batch)
+
+    async def close(self):
+        ''' Writes the queued messages and stops the background writer. Messages put after close are dropped. '''
+        self._stopping = True
+        if self._task is not None:
+            await self._task
+            self._task = None
+        self._executor.shutdown(wait=True)
+        logger.info(f'database sink closed: {self.inserted} message(s) in {self.batches} batches, '\
+                    f'{self.dropped} dropped, {self.failed} failed')
+
+    @property
+    def closed(self):
+        return self._stopping
+
+    def stats(self):
+        ''' Returns the statistics of the sink as dict '''
+        return {
+            'inserted': self.inserted,
+            'batches': self.batches,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'queued': self._queue.qsize(),
+            'max_delay_s': self.max_delay,
+        }
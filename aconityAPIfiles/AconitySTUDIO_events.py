@@ -0,0 +1,271 @@
+import asyncio
+import inspect
+import logging
+
+from collections import defaultdict, deque, OrderedDict
+
+logger = logging.getLogger(__package__)
+
+def get_channel(msg):
+    ''' Returns the channel a websocket message refers to (only set for the run report), else None '''
+    try:
+        return msg['data'][0]['channel']
+    except (KeyError, IndexError, TypeError):
+        return None
+
+class Subscription:
+    '''
+    A queue of websocket messages for one (topic, channel) combination.
+    Created by `EventBus.subscribe`, the user does not need to instantiate it directly.
+
+    Messages published after the subscription was created are buffered,
+    so a subscription created *before* a request is sent will never miss the answer.
+    If more than `maxsize` messages are buffered, the oldest ones are dropped.
+
+    Usage::
+
+        with client.bus.subscribe('run', channel='manual_move') as subscription:
+            await client.post(...)
+            async for msg in subscription:
+                ...
+    '''
+    def __init__(self, bus, topic, channel, maxsize):
+        self.bus = bus
+        self.topic = topic
+        self.channel = channel
+        self.dropped = 0
+        self._queue = asyncio.Queue(maxsize)
+
+    def put(self, msg):
+        ''' Adds a message to the queue. Drops the oldest message if the queue is full. '''
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f'subscription ({self.topic}, {self.channel}) is full, dropped {self.dropped} message(s)')
+        self._queue.put_nowait(msg)
+
+    async def get(self):
+        ''' Waits for and returns the next message '''
+        return await self._queue.get()
+
+    def close(self):
+        ''' Stops receiving messages '''
+        self.bus.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._queue.get()
+
+class EventBus:
+    '''
+    In-process publish/subscribe bus for the messages of the (single) websocket connection.
+
+    The client publishes every received message. Subscribers select messages by
+    topic ('run', 'cmds', 'Positioning', ...) and optionally by channel ('run0', 'manual_move', ...).
+    `topic=None` subscribes to all messages.
+    '''
+    def __init__(self):
+        self._subscriptions = defaultdict(list)
+
+    def subscribe(self, topic=None, channel=None, maxsize=1000):
+        '''
+        Creates a new subscription.
+
+        :param topic: topic of the messages, None for all topics.
+        :type topic: string
+
+        :param channel: only receive messages of this channel. None for all channels.
+        :type channel: string
+
+        :param maxsize: maximum number of buffered messages. 0 means unbounded.
+        :type maxsize: int
+
+        :rtype: Subscription
+        '''
+        subscription = Subscription(self, topic, channel, maxsize)
+        self._subscriptions[(topic, channel)].append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        ''' Removes a subscription. Unsubscribing twice is allowed. '''
+        key = (subscription.topic, subscription.channel)
+        try:
+            self._subscriptions.get(key, []).remove(subscription)
+        except ValueError:
+            return
+        if not self._subscriptions[key]:
+            del self._subscriptions[key]
+
+    def has_subscribers(self, topic):
+        ''' Returns True if anybody listens to the given topic '''
+        return any(key[0] in (topic, None) for key in self._subscriptions)
+
+    def publish(self, msg):
+        ''' Delivers a message to all matching subscriptions '''
+        topic = msg.get('topic') if isinstance(msg, dict) else None
+        channel = get_channel(msg)
+
+        keys = [(None, None)]
+        if topic is not None:
+            keys.append((topic, None))
+        if topic is not None and channel is not None:
+            keys.append((topic, channel))
+
+        for key in keys:
+            for subscription in self._subscriptions.get(key, ()):
+                subscription.put(msg)
+
+PROCESSOR_POLICIES = ('inline', 'task', 'thread', 'process')
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'coalesce')
+
+class ProcessorRunner:
+    '''
+    Calls a websocket message processor with an execution policy.
+    Created by `AconitySTUDIO_client.add_processor`, the user does not need to instantiate it directly.
+
+    Policies:
+
+        - 'inline': `processor(client, msg)` is called in the receive loop (the receive loop waits for it).
+        - 'task': the messages are queued and handled by an asyncio task. The processor can be a coroutine function.
+        - 'thread': like 'task', but `processor(client, msg)` runs in a thread pool.
+          Do not modify msg, the other subscribers get the same object.
+        - 'process': like 'task', but `processor(msg)` (without the client) runs in a process pool.
+          The processor must be a module level function and msg gets pickled.
+
+    If more than `maxsize` messages are waiting, the `overflow` policy decides:
+    'drop_oldest' and 'drop_newest' drop a message, 'coalesce' only keeps the newest message
+    of every topic (for processors which only need the current state). With 'coalesce' `maxsize` limits
+    the number of topics waiting, if a new topic arrives beyond that the topic waiting longest is dropped.
+    '''
+    def __init__(self, processor, topics=None, policy='inline', maxsize=1000, overflow='drop_oldest', executor=None):
+        if policy not in PROCESSOR_POLICIES:
+            raise ValueError(f'unknown processor policy {policy}, use one of {PROCESSOR_POLICIES}')
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'unknown overflow policy {overflow}, use one of {OVERFLOW_POLICIES}')
+        if policy in ('thread', 'process') and executor is None:
+            raise ValueError(f'processor policy {policy} needs an executor')
+        self.processor = processor
+        self.name = getattr(processor, '__name__', repr(processor))
+        self.topics = None if topics is None else set(topics)
+        self.policy = policy
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.executor = executor
+
+        # statistics
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_depth = 0
+
+        self._pending = OrderedDict() if overflow == 'coalesce' else deque() # coalesce: topic -> newest msg
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def wants(self, topic):
+        ''' Returns True if the processor gets messages of the topic '''
+        return self.topics is None or topic in self.topics
+
+    @property
+    def depth(self):
+        ''' Number of waiting messages '''
+        return len(self._pending)
+
+    def submit(self, client, msg):
+        ''' Processes a message (inline) or queues it for the worker task '''
+        if self.policy == 'inline':
+            try:
+                self.processor(client, msg)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception(f'processing ({self.name}) ws msg raised an exception.\n')
+            return
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(client))
+        if self.overflow == 'coalesce':
+            topic = msg.get('topic') if isinstance(msg, dict) else None
+            if topic in self._pending:
+                del self._pending[topic]
+                self.dropped += 1
+            elif len(self._pending) >= self.maxsize: # too many topics, the oldest one is dropped
+                self._pending.popitem(last=False)
+                self._count_drop()
+            self._pending[topic] = msg
+        else:
+            if len(self._pending) >= self.maxsize:
+                self._count_drop()
+                if self.overflow == 'drop_newest':
+                    return
+                self._pending.popleft()
+            self._pending.append(msg)
+        self.max_depth = max(self.max_depth, len(self._pending))
+        self._wakeup.set()
+
+    def _count_drop(self):
+        self.dropped += 1
+        if self.dropped == 1 or self.dropped % 1000 == 0:
+            logger.warning(f'processor {self.name} falls behind, dropped {self.dropped} message(s)')
+
+    def _next(self):
+        if self.overflow == 'coalesce':
+            return self._pending.popitem(last=False)[1]
+        return self._pending.popleft()
+
+    async def _call(self, client, msg):
+        loop = asyncio.get_running_loop()
+        try:
+            if self.policy == 'task':
+                result = self.processor(client, msg)
+                if inspect.isawaitable(result):
+                    await result
+            elif self.policy == 'thread':
+                await loop.run_in_executor(self.executor, self.processor, client, msg)
+            else:
+                await loop.run_in_executor(self.executor, self.processor, msg)
+            self.processed += 1
+        except Exception:
+            self.failed += 1
+            logger.exception(f'processing ({self.name}) ws msg raised an exception.\n')
+
+    async def _run(self, client):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                await self._call(client, self._next())
+
+    def stop(self):
+        ''' Cancels the worker task, waiting messages are discarded '''
+        if self._task is not None:
+            self._task.cancel()
+        self._pending.clear()
+
+    async def close(self):
+        ''' Stops the worker task and waits until it is finished '''
+        task = self._task
+        self.stop()
+        self._task = None
+        if task is not None:
+            await asyncio.gather(task, return_exceptions=True)
+
+    def stats(self):
+        ''' Returns the statistics of the processor as dict '''
+        return {
+            'policy': self.policy,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+        }
@@ -0,0 +1,420 @@
+'''
+A local stand-in for the AconitySTUDIO server.
+
+Implements the REST routes and the /connect websocket used by the Python Client,
+so scripts like executeScript can run (and be benchmarked) without the real machine.
+Moves, layers and requests take simulated time, which can be configured.
+
+Usage::
+
+    python AconitySTUDIO_simulator.py --port 9000 --layer-time 2
+
+and log in with the client using rest_url 'http://127.0.0.1:9000' and ws_url 'ws://127.0.0.1:9000'.
+'''
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import re
+import time
+
+from aiohttp import web, WSMsgType
+
+logger = logging.getLogger(__package__)
+
+MOVE_PATTERN = re.compile(r'\$m\.move_(abs|rel)\(\s*\$c\[(\w+)\]\s*,\s*([-+\d.eE]+)\s*(?:,\s*([-+\d.eE]+))?\s*\)')
+
+_object_ids = itertools.count(1)
+
+def object_id():
+    ''' Returns a new MongoDB-like object id '''
+    return {'$oid': f'{next(_object_ids):024x}'}
+
+def interval_param(name, value, minimum, maximum, type='doubleInterval'):
+    ''' Returns an interval parameter as stored in the job documents '''
+    return {'name': name, 'type': type, 'value': {'value': value, 'min': minimum, 'max': maximum}, 'dirty': False}
+
+def make_job(name='simulated_job', number_of_parts=4, lasers=(1,)):
+    '''
+    Creates a synthetic job document with the same structure as the AconitySTUDIO jobs.
+
+    :param number_of_parts: number of (sub)parts of the job
+    :type number_of_parts: int
+    '''
+    scanner_values = ['*'] + [f'scanner_{laser}' for laser in lasers]
+    part_params = lambda: [
+        {'name': 'scanner', 'type': 'enum', 'value': '*', 'values': scanner_values, 'dirty': False},
+        interval_param('laser_power', 100.0, 0.0, 400.0),
+        interval_param('mark_speed', 800.0, 10.0, 5000.0),
+        interval_param('repetitions', 1, 1, 10, type='intInterval'),
+        {'name': 'skip', 'type': 'bool', 'value': False, 'dirty': False},
+    ]
+    partRefs = [{'name': '[all]', 'subparts': [], 'params': part_params()}]
+    for i in range(number_of_parts):
+        partRefs.append({
+            'name': f'part_{i + 1:03d}',
+            'pid': object_id(),
+            'position': [0.0, 0.0, 0.0],
+            'key': [i],
+            'params': part_params(),
+            'subparts': [{
+                'index': i + 1,
+                'name': f'_modelsection_{i + 1:03d}_s1_vs',
+                'params': part_params(),
+            }],
+        })
+    return {
+        '_id': object_id(),
+        'name': name,
+        'params': [
+            interval_param('supply_factor', 1.5, 1.0, 5.0),
+            interval_param('return_velocity', 100, 1, 500, type='intInterval'),
+            {'name': 'recoating', 'type': 'bool', 'value': True, 'dirty': False},
+        ],
+        'partRefs': partRefs,
+    }
+
+class AconitySTUDIO_simulator:
+    '''
+    Simulated machine controller.
+
+    :param rest_latency: delay (s) added to every http request.
+    :param ws_latency: delay (s) between an event and its websocket message.
+    :param layer_time: time (s) the exposure of one layer takes.
+    :param position_interval: time (s) between two Positioning messages of a moving axis.
+    :param time_scale: factor applied to the duration of moves (0.1 = ten times faster than real time).
+    :param job_etags: answer job requests with an ETag and conditional GETs with 304 Not Modified.
+    '''
+    def __init__(self, machine_name='1.4404', config_name='simulated_config', job_name='simulated_job',
+                 number_of_parts=4, rest_latency=0.0, ws_latency=0.0, layer_time=1.0,
+                 position_interval=0.05, time_scale=1.0, job_etags=True):
+        self.rest_latency = rest_latency
+        self.ws_latency = ws_latency
+        self.layer_time = layer_time
+        self.position_interval = position_interval
+        self.time_scale = time_scale
+        self.job_etags = job_etags
+
+        self.machine = {'_id': object_id(), 'name': machine_name}
+        self.config = {'_id': object_id(), 'name': config_name, 'state': 'operational'}
+        self.components = [{'id': 'laser_beam_source::1::'}, {'id': 'slider'}, {'id': 'platform'}]
+        job = make_job(job_name, number_of_parts)
+        self.jobs = {job['_id']['$oid']: job}
+        self.job_versions = {job['_id']['$oid']: 1}
+
+        self.positions = {'slider': 300.0, 'platform': 17.9}
+        self.counts = {'AddLayerCommand': 0}
+        self.channels = {} # channel -> running asyncio task
+        self.pause_requested = {}
+        self.resume_events = {}
+        self.script = None
+        self.workunit_ids = itertools.count(1)
+        self.sockets = {} # websocket -> set of registered names
+        self.requests = 0
+
+        self.app = web.Application(middlewares=[self._latency_middleware])
+        self.app.add_routes([
+            web.post('/login', self.login),
+            web.get('/ping', self.ping),
+            web.get('/connect', self.connect),
+            web.get('/machines', self.get_machines),
+            web.get('/machines/{id}', self.get_machine),
+            web.get('/machines/{id}/functions', self.get_functions),
+            web.get('/configurations', self.get_configurations),
+            web.get('/configurations/{id}', self.get_configuration),
+            web.get('/configurations/{id}/components', self.get_components),
+            web.get('/jobs', self.get_jobs),
+            web.get('/jobs/{id}', self.get_job),
+            web.put('/jobs/{id}', self.put_job),
+            web.get('/script', self.get_script),
+            web.post('/script/{channel}', self.post_script),
+            web.get('/script/{wid}/pause/{channel}', self.pause_script),
+            web.post('/script/{wid}/resume/{channel}', self.resume_script),
+            web.get('/script/{wid}/stop/{channel}', self.stop_script),
+            web.get('/stop/channel/{channel}', self.stop_channel),
+            web.post('/machine/{id}/execute/{channel}', self.execute),
+        ])
+        self._runner = None
+
+    ###########
+    # SERVING #
+    ###########
+
+    async def start(self, host='127.0.0.1', port=9000):
+        ''' Starts serving in the running event loop. Returns the base url (http://host:port) '''
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1] # resolves port=0
+        self.url = f'{host}:{port}'
+        logger.info(f'simulator listening on {self.url}')
+        return self.url
+
+    async def stop(self):
+        ''' Stops all simulated activity and the server '''
+        for task in list(self.channels.values()):
+            task.cancel()
+        for ws in list(self.sockets):
+            await ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def login_data(self, email='simulator@localhost', password='simulator'):
+        ''' Returns login data for the client (call after start) '''
+        return {
+            'rest_url': f'http://{self.url}',
+            'ws_url': f'ws://{self.url}',
+            'email': email,
+            'password': password,
+        }
+
+    @web.middleware
+    async def _latency_middleware(self, request, handler):
+        self.requests += 1
+        if self.rest_latency > 0:
+            await asyncio.sleep(self.rest_latency)
+        return await handler(request)
+
+    #############
+    # WEBSOCKET #
+    #############
+
+    async def connect(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.sockets[ws] = set()
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                task = json.loads(msg.data)
+                if task.get('task') == 'register':
+                    self.sockets[ws].add(task['name'])
+        finally:
+            self.sockets.pop(ws, None)
+        return ws
+
+    async def drop_websockets(self):
+        ''' Closes all websocket connections, e.g. to test the reconnect of the client '''
+        for ws in list(self.sockets):
+            await ws.close()
+
+    def publish(self, topic, data):
+        ''' Sends a message to every websocket registered for the topic (after ws_latency) '''
+        msg = json.dumps({'topic': topic, 'data': data})
+        for ws, registrations in list(self.sockets.items()):
+            if topic in registrations:
+                asyncio.create_task(self._send(ws, msg, time.monotonic() + self.ws_latency))
+
+    async def _send(self, ws, msg, send_at):
+        delay = send_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            await ws.send_str(msg)
+        except (ConnectionResetError, RuntimeError):
+            pass # the client disconnected
+
+    def publish_run(self, channel, msg):
+        self.publish('run', [{'channel': channel, 'msg': msg}])
+
+    def publish_counts(self):
+        self.publish('cmds', [{'name': 'report', 'value': json.dumps({'counts': self.counts})}])
+
+    def publish_position(self, axis):
+        self.publish('Positioning', [{'cid': axis, 'value': round(self.positions[axis], 4)}])
+
+    ##############
+    # REST ROUTES #
+    ##############
+
+    async def login(self, request):
+        return web.json_response({'authToken': 'simulated-token', 'userId': 'simulated-user'})
+
+    async def ping(self, request):
+        return web.json_response({'success': 'pong'})
+
+    async def get_machines(self, request):
+        return web.json_response([self.machine])
+
+    async def get_machine(self, request):
+        if request.match_info['id'] != self.machine['_id']['$oid']:
+            raise web.HTTPNotFound()
+        return web.json_response(self.machine)
+
+    async def get_functions(self, request):
+        return web.json_response({'functions': [{'call': '$m.off', 'components': ['laser_emission']}]})
+
+    async def get_configurations(self, request):
+        return web.json_response([self.config])
+
+    async def get_configuration(self, request):
+        if request.match_info['id'] != self.config['_id']['$oid']:
+            raise web.HTTPNotFound()
+        return web.json_response(self.config)
+
+    async def get_components(self, request):
+        return web.json_response(self.components)
+
+    async def get_jobs(self, request):
+        return web.json_response([{'_id': job['_id'], 'name': job['name']} for job in self.jobs.values()])
+
+    def _job_headers(self, job_id):
+        return {'ETag': f'"{job_id}-{self.job_versions[job_id]}"'} if self.job_etags else {}
+
+    async def get_job(self, request):
+        job_id = request.match_info['id']
+        if job_id not in self.jobs:
+            raise web.HTTPNotFound()
+        headers = self._job_headers(job_id)
+        if headers and request.headers.get('If-None-Match') == headers['ETag']:
+            return web.Response(status=304, headers=headers)
+        return web.json_response(self.jobs[job_id], headers=headers)
+
+    async def put_job(self, request):
+        job_id = request.match_info['id']
+        if job_id not in self.jobs:
+            raise web.HTTPNotFound()
+        self.jobs[job_id] = await request.json()
+        self.job_versions[job_id] += 1
+        return web.json_response(self.jobs[job_id], headers=self._job_headers(job_id))
+
+    async def get_script(self, request):
+        return web.json_response({'success': 'script received', 'script': self.script,
+                                  'counts': self.counts})
+
+    async def post_script(self, request):
+        channel = request.match_info['channel']
+        if channel in self.channels and not self.channels[channel].done():
+            return web.json_response({'error': 'error(s) in script. Could not execute! =>\nchannel is occupied'})
+        data = await request.json()
+        layers = re.search(r'\$p\.select\((\d+),(\d+)\)', data.get('init', ''))
+        start, end = (int(layers.group(1)), int(layers.group(2))) if layers else (1, 1)
+
+        workunit_id = f'workunit_{next(self.workunit_ids)}'
+        execution = {'workUnit': {'workUnitId': workunit_id}, 'channel': channel}
+        self.script = {'execution': execution}
+        self.counts['AddLayerCommand'] = 0
+        self.pause_requested[channel] = False
+        self.channels[channel] = asyncio.create_task(self._run_job(channel, end - start + 1))
+        return web.json_response({'success': 'script received', 'execution': execution})
+
+    async def pause_script(self, request):
+        channel = request.match_info['channel']
+        self.pause_requested[channel] = True # takes effect once the current layer is finished
+        return web.json_response({'success': 'machine will pause ...'})
+
+    async def resume_script(self, request):
+        channel = request.match_info['channel']
+        data = await request.json()
+        workunit_id = request.match_info['wid']
+        layers = re.search(r'\$p\.select\((\d+),(\d+)\)', data.get('init', ''))
+        if layers:
+            self.layers_left = int(layers.group(2)) - int(layers.group(1)) + 1
+        self.pause_requested[channel] = False
+        event = self.resume_events.get(channel)
+        if event is None:
+            return web.json_response({'success': 'nothing to resume', 'resumed': False})
+        event.set()
+        return web.json_response({'success': 'execution will resume ...', 'resumed': True, 'execution': workunit_id})
+
+    async def stop_script(self, request):
+        channel = request.match_info['channel']
+        self._stop(channel)
+        return web.json_response({'success': 'machine will stop ...'})
+
+    async def stop_channel(self, request):
+        self._stop(request.match_info['channel'])
+        return web.json_response({'success': 'channel stopped'})
+
+    async def execute(self, request):
+        channel = request.match_info['channel']
+        data = await request.json()
+        if channel in self.channels and not self.channels[channel].done():
+            return web.json_response({'error': f'channel {channel} is occupied'})
+        self.channels[channel] = asyncio.create_task(self._run_code(channel, data['code']))
+        return web.json_response({'success': 'command received'})
+
+    ##############
+    # SIMULATION #
+    ##############
+
+    def _stop(self, channel):
+        task = self.channels.get(channel)
+        if task is not None and not task.done():
+            task.cancel()
+        self.resume_events.pop(channel, None)
+        self.publish_run(channel, 'stopped')
+
+    async def _run_code(self, channel, code):
+        ''' Executes manual commands (moves) '''
+        self.publish_run(channel, 'resumed')
+        for kind, axis, value, speed in MOVE_PATTERN.findall(code):
+            target = float(value) if kind == 'abs' else self.positions.get(axis, 0.0) + float(value)
+            await self._move(axis, target, float(speed) if speed else 100.0)
+        self.publish_run(channel, 'finished')
+
+    async def _move(self, axis, target, speed):
+        ''' Moves an axis with the given speed (units/s), publishing its position '''
+        start = self.positions.get(axis, 0.0)
+        duration = abs(target - start) / max(speed, 1e-6) * self.time_scale
+        t_start = time.monotonic()
+        while True:
+            fraction = 1.0 if duration == 0 else min(1.0, (time.monotonic() - t_start) / duration)
+            self.positions[axis] = start + (target - start) * fraction
+            self.publish_position(axis)
+            if fraction >= 1.0:
+                return
+            await asyncio.sleep(min(self.position_interval, max(duration * (1.0 - fraction), 0.001)))
+
+    async def _run_job(self, channel, number_of_layers):
+        ''' Exposes layers, pausing after a layer if a pause was requested '''
+        self.layers_left = number_of_layers
+        self.publish_run(channel, 'started')
+        while self.layers_left > 0:
+            await asyncio.sleep(self.layer_time)
+            self.layers_left -= 1
+            self.counts['AddLayerCommand'] += 1
+            self.publish_counts()
+            if self.pause_requested.get(channel) and self.layers_left > 0:
+                self.resume_events[channel] = asyncio.Event()
+                self.publish_run(channel, 'paused')
+                await self.resume_events[channel].wait()
+                self.resume_events.pop(channel, None)
+                self.publish_run(channel, 'resumed')
+        self.publish_run(channel, 'finished')
+
+async def serve(host, port, **kwargs):
+    simulator = AconitySTUDIO_simulator(**kwargs)
+    await simulator.start(host, port)
+    print(f'AconitySTUDIO simulator running on http://{simulator.url} (ctrl+c to stop)')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await simulator.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description='Local AconitySTUDIO simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--parts', type=int, default=4, help='number of parts of the simulated job')
+    parser.add_argument('--rest-latency', type=float, default=0.0)
+    parser.add_argument('--ws-latency', type=float, default=0.0)
+    parser.add_argument('--layer-time', type=float, default=1.0)
+    parser.add_argument('--time-scale', type=float, default=1.0)
+    parser.add_argument('--no-etags', action='store_true', help='do not send ETags for jobs (like a server without conditional requests)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.host, args.port, number_of_parts=args.parts,
+                          rest_latency=args.rest_latency, ws_latency=args.ws_latency,
+                          layer_time=args.layer_time, time_scale=args.time_scale,
+                          job_etags=not args.no_etags))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+import array
+import logging
+import time
+
+try:
+    import numpy as np # optional, the buffers are numpy arrays if it is installed
+except ImportError:
+    np = None
+
+import AconitySTUDIO_utils as utils
+
+logger = logging.getLogger(__package__)
+
+def _buffer(capacity):
+    ''' Preallocated float64 buffer '''
+    if np is not None:
+        return np.zeros(capacity, dtype=np.float64)
+    return array.array('d', bytes(8 * capacity))
+
+def _copy(buffer, start, stop):
+    ''' Copy of buffer[start:stop] (slices of an array.array already are copies) '''
+    part = buffer[start:stop]
+    return part.copy() if np is not None else part
+
+def _concat(first, second):
+    if np is not None:
+        return np.concatenate((first, second))
+    return first + second
+
+class RingBuffer:
+    '''
+    Fixed-size columnar buffer of (timestamp, value) samples of one signal.
+    If it is full, new samples overwrite the oldest ones, so the memory use never grows.
+
+    The timestamps are kept in ascending order (a sample older than the newest one gets the newest timestamp),
+    which allows to find time windows with a binary search.
+    Queries return copies: numpy arrays if numpy is installed, else array.array('d').
+    '''
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError(f'capacity must be at least 1, not {capacity}')
+        self.capacity = capacity
+        self.timestamps = _buffer(capacity)
+        self.values = _buffer(capacity)
+        self.size = 0
+        self._next = 0 # position of the next sample
+
+    def __len__(self):
+        return self.size
+
+    def append(self, timestamp, value):
+        ''' Adds a sample, overwriting the oldest one if the buffer is full '''
+        if self.size and timestamp < self.timestamps[self._next - 1]:
+            timestamp = self.timestamps[self._next - 1]
+        self.timestamps[self._next] = timestamp
+        self.values[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def _position(self, index):
+        ''' Position in the buffers of the index-th oldest sample '''
+        return (self._next - self.size + index) % self.capacity
+
+    def _bisect(self, timestamp, right=False):
+        ''' Index of the first sample with a timestamp >= timestamp (> timestamp if right) '''
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            t = self.timestamps[self._position(middle)]
+            if t < timestamp or (right and t == timestamp):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _range(self, start, stop):
+        ''' Copies of the timestamps and values of the samples start ... stop-1 (oldest first) '''
+        count = max(stop - start, 0)
+        first = self._position(start) if count else 0
+        if first + count <= self.capacity:
+            return _copy(self.timestamps, first, first + count), _copy(self.values, first, first + count)
+        wrapped = first + count - self.capacity
+        return _concat(self.timestamps[first:], self.timestamps[:wrapped]), \
+               _concat(self.values[first:], self.values[:wrapped])
+
+    def window(self, start=None, end=None):
+        '''
+        Returns (timestamps, values) of all samples with start <= timestamp <= end.
+
+        :param start: first timestamp, None for the oldest sample
+        :type start: float
+
+        :param end: last timestamp, None for the newest sample
+        :type end: float
+
+        :rtype: tuple
+        '''
+        first = 0 if start is None else self._bisect(start)
+        stop = self.size if end is None else self._bisect(end, right=True)
+        return self._range(first, stop)
+
+    def latest(self):
+        ''' Returns (timestamp, value) of the newest sample, or None if the buffer is empty '''
+        if not self.size:
+            return None
+        return self.timestamps[self._next - 1], self.values[self._next - 1]
+
+class TelemetryStore:
+    '''
+    In-memory history of the numeric signals of websocket messages, one RingBuffer per (topic, signal).
+
+    A signal is an entry of msg['data'] with a 'cid' (or 'name') and a numeric 'value' (see utils.get_signals),
+    for example the axis positions of the Positioning topic. Only topics the client subscribed to arrive.
+
+    Usage::
+
+        store = TelemetryStore(capacity=10000)
+        store.record(msg)
+        timestamps, values = store.query('Positioning', 'slider', last=30)
+
+    :param capacity: number of samples kept per signal
+    :type capacity: int
+
+    :param topics: only record these topics, None for all
+    :type topics: list
+    '''
+    def __init__(self, capacity=10000, topics=None):
+        self.capacity = capacity
+        self.topics = None if topics is None else set(topics)
+        self._buffers = {} # (topic, signal) -> RingBuffer
+
+    def records(self, topic):
+        ''' Returns True if messages of the topic are recorded '''
+        return self.topics is None or topic in self.topics
+
+    def record(self, msg, timestamp=None):
+        '''
+        Adds the numeric signals of a websocket message.
+
+        :param timestamp: unix time of the message, default now
+        :type timestamp: float
+        '''
+        topic = msg.get('topic') if isinstance(msg, dict) else None
+        if topic is None or (self.topics is not None and topic not in self.topics):
+            return
+        signals = utils.get_signals(msg)
+        if not signals:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        for signal, value in signals.items():
+            buffer = self._buffers.get((topic, signal))
+            if buffer is None:
+                buffer = self._buffers[(topic, signal)] = RingBuffer(self.capacity)
+            buffer.append(timestamp, value)
+
+    def signals(self, topic=None):
+        ''' Returns the recorded (topic, signal) pairs, optionally only of one topic '''
+        return sorted(key for key in self._buffers if topic is None or key[0] == topic)
+
+    def query(self, topic, signal, last=None, start=None, end=None, max_points=None):
+        '''
+        Returns (timestamps, values) of a signal, oldest first. Unknown signals give empty results.
+
+        :param last: only the last `last` seconds (overrides start)
+        :type last: float
+
+        :param start: first unix time
+        :type start: float
+
+        :param end: last unix time
+        :type end: float
+
+        :param max_points: downsample to at most max_points samples by keeping every n-th sample
+            (the newest sample is always kept)
+        :type max_points: int
+
+        :rtype: tuple
+        '''
+        buffer = self._buffers.get((topic, signal))
+        if buffer is None:
+            return _buffer(0), _buffer(0)
+        if last is not None:
+            start = time.time() - last
+        timestamps, values = buffer.window(start, end)
+        if max_points is not None and len(timestamps) > max_points > 0:
+            step = -(-len(timestamps) // max_points)
+            offset = (len(timestamps) - 1) % step
+            timestamps, values = timestamps[offset::step], values[offset::step]
+        return timestamps, values
+
+    def latest(self, topic, signal):
+        ''' Returns (timestamp, value) of the newest sample of a signal, or None '''
+        buffer = self._buffers.get((topic, signal))
+        return None if buffer is None else buffer.latest()
+
+    def clear(self):
+        ''' Removes all recorded samples '''
+        self._buffers.clear()
@@ -6,6 +6,11 @@ import decorator
 import json
 import asyncio
 
+try:
+    import orjson # optional, faster serialization of the script parameters
+except ImportError:
+    orjson = None
+
 from collections import defaultdict
 
 ADRESS = {
@@ -95,6 +100,65 @@ def customTime(*args):
     converted = utc_dt.astimezone(my_tz)
     return converted.timetuple()
 
+def to_script_json(data):
+    '''
+    Serializes parameters (lists and dicts of strings, numbers, booleans and None)
+    as compact JSON for an AconityScript, e.g. [{"name":"laser_power","value":100.0}].
+    Uses orjson if it is installed, the result is the same without it:
+    non-string dict keys are converted to strings and NaN/Infinity raise a ValueError (they are no valid JSON).
+    '''
+    if orjson is not None:
+        try:
+            text = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError: # e.g. integers beyond 64 bit, json can handle them
+            text = None
+        # orjson writes NaN/Infinity as null | only then json is needed to find out
+        if text is not None and b'null' not in text:
+            return text.decode()
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False, allow_nan=False)
+
+def peek_topic(text, search_length = 256):
+    '''
+    Returns the topic of a websocket message without parsing it, e.g. 'Sensor' for '{"topic":"Sensor","data":[...]}'.
+    Only a "topic" that is the first key of the message counts, a "topic" further in could belong to a nested object.
+    Returns None if the message does not start like that (then the message has to be parsed).
+    '''
+    text = text[:search_length]
+    if isinstance(text, bytes):
+        text = text.decode('utf-8', 'replace')
+    position = 0
+    for token in ('{', '"topic"', ':', '"'):
+        while position < len(text) and text[position] in ' \t\r\n':
+            position += 1
+        if not text.startswith(token, position):
+            return None
+        position += len(token)
+    end = text.find('"', position)
+    if end < 0 or '\\' in text[position:end]:
+        return None
+    return text[position:end]
+
+def decode_ws_msg(text):
+    '''
+    Parses a websocket message. Uses orjson if it is installed.
+    Messages with nans (see fix_ws_msg) are only repaired if the normal parsing fails.
+    '''
+    try:
+        if orjson is not None:
+            return orjson.loads(text)
+        return json.loads(text)
+    except ValueError:
+        if isinstance(text, bytes):
+            text = text.decode('utf-8')
+        return json.loads(fix_ws_msg(text))
+
+def parameter_value(parameter):
+    ''' Returns the value of a job parameter (for interval parameters the value inside of the interval) '''
+    value = parameter['value']
+    if isinstance(value, dict) and 'value' in value:
+        return value['value']
+    return value
+
 def filter_out_keys(data, allowed = ['name', 'type', 'value']):
     ''' Loop through input dictionary and only retain the 'name', 'type', 'value' keys '''
     new = []
@@ -119,9 +183,58 @@ class JobHandler:
         self.laser_dict.update({str(i) : f'scanner_{i}' for i in range(64)})
         self.laser_dict['*'] = '*'
         #self.names_global_params = [param['name'] for param in job['params']]
+        self.changes = [] # change log: (part_id or 'global', param, old value, new value)
+        self.clear_cache()
+
+    def clear_cache(self):
+        '''
+        Forgets all rendered script blocks. They are rendered again on the next call to
+        create_init_script / create_init_resume_script.
+        '''
+        self._addParts = None
+        self._global_block = None # '$g.params(...)' line
+        self._part_blocks = {} # subpart index -> '$p[index].params(...)' line
+        self._stale_parts = set() # subpart indices changed since their line was rendered
+        self._preStartParams = None
+        self._use_lines = {} # parts -> '$p.use(...)' line
+        self._index = None # lookup tables for parts and parameters, see _get_index()
+
+    def _get_index(self):
+        '''
+        Returns lookup tables for the parts and parameters of the job (built once per job):
+
+            'parts': part index -> (partRef, subpart)
+            'part_params': (part index, parameter name) -> list of parameter dicts
+            'global_params': parameter name -> position in job['params']
+        '''
+        if self._index is not None:
+            return self._index
+
+        parts = {}
+        part_params = {}
+        for partRef in self.job['partRefs']:
+            for subpart in partRef['subparts']:
+                idx = int(subpart['index'])
+                if idx in parts: # the first subpart with an index is the one which gets changed
+                    continue
+                parts[idx] = (partRef, subpart)
+                for parameter in subpart['params']:
+                    part_params.setdefault((idx, parameter['name']), []).append(parameter)
+
+        global_params = {}
+        for i, parameter in enumerate(self.job['params']):
+            global_params.setdefault(parameter['name'], i)
+
+        self._index = {'parts': parts, 'part_params': part_params, 'global_params': global_params}
+        return self._index
 
     def convert_to_string(self, data=None):
-        '''Convert input data type into a sring.'''
+        '''
+        Convert input data type into a sring.
+
+        Deprecated: removes all spaces and replaces True/False everywhere, also inside of
+        string values. The scripts are created with to_script_json().
+        '''
         if data==None:
             data = self.job
         data = data.replace('False','false')
@@ -132,6 +245,7 @@ class JobHandler:
     def set(self, job):
         ''' Set the internal job variable to the input job '''
         self.job = job
+        self.clear_cache()
 
     def to_json(self):
         ''' Convert current job to json '''
@@ -154,6 +268,13 @@ class JobHandler:
 
     def get_mapping_parts_to_index(self):
         ''' Returns the indices of the job parts'''
+        index = self._get_index()
+        if 'mapping' not in index:
+            index['mapping'] = self._create_mapping_parts_to_index()
+        self.part_indices, self.part_dictionary = index['mapping']
+        return self.part_indices, self.part_dictionary
+
+    def _create_mapping_parts_to_index(self):
         partRefs = self.job['partRefs']
         non_unique_names = False
         # simply a list with indices [1,2,3,...]
@@ -193,6 +314,12 @@ class JobHandler:
 
     def get_lasers(self):
         ''' Returns the available lasers '''
+        index = self._get_index()
+        if 'lasers' not in index:
+            index['lasers'] = self._find_lasers()
+        return index['lasers']
+
+    def _find_lasers(self):
         params = self.job['partRefs'][0]['params']
         for param in params:
             if param['name'] == 'scanner':
@@ -201,7 +328,12 @@ class JobHandler:
                 return lasers, laser_list
 
     def create_addParts(self):
-        ''' Returns the commands to add parts to the job '''
+        ''' Returns the commands to add parts to the job (rendered once per job) '''
+        if self._addParts is None:
+            self._addParts = self._render_addParts()
+        return self._addParts
+
+    def _render_addParts(self):
         addParts = 'addParts = function(){'
         partRefs = self.job['partRefs']
 
@@ -227,43 +359,66 @@ class JobHandler:
         return addParts
 
     def create_preStartParams(self):
-        ''' Returns the parameters set before the start of the build '''
-        preStartParams = 'preStartParams = function(){'
-
-        g = f"{self.job['params']}"
-
-        if g == '[]':
-            self.logger.error('global parameters not imported')
-            raise ValueError('global parameters not imported')
-        g = self.convert_to_string(g)
-
-        preStartParams += f'\n    $g.params({g})'
+        '''
+        Returns the parameters set before the start of the build.
+
+        The rendered lines are cached. Only the global line and the part lines changed by
+        change_global_parameter / change_part_parameter (the parameters marked dirty) are rendered again.
+        '''
+        if self._preStartParams is not None and self._global_block is not None and not self._stale_parts:
+            return self._preStartParams
+
+        if self._global_block is None:
+            if self.job['params'] == []:
+                self.logger.error('global parameters not imported')
+                raise ValueError('global parameters not imported')
+            self._global_block = f'\n    $g.params({to_script_json(self.job["params"])})'
+
+        lines = [self._global_block]
         partRefs = self.job['partRefs']
 
         for partRef in partRefs:
             name = partRef['name']
             if '[all]' not in name:
                 for subpart in partRef['subparts']:
-                    #print('SUBPART', subpart['params'])
-                    subpart_params = filter_out_keys(subpart['params'])
-                    if subpart_params == []:
-                        self.logger.error('part parameters not imported')
-                        raise ValueError('part parameters not imported')
-                    #print('\n\n\n\nADDING:', subpart_params,'\n\n\n')
-                    subpart_pars = self.convert_to_string(f"{subpart_params}")
-                    #subpart_pars = self.convert_to_string(f"{subpart['params']}")
                     idx = int(subpart['index'])
-                    preStartParams += f'\n    $p[{idx}].params({subpart_pars})'
-
-        preStartParams += '\n\n}'
-
-        #TODO are these necessary? when?
-        preStartParams = preStartParams.replace("'",'\"')
-        #preStartParams = preStartParams.replace(' ','')
-        return preStartParams
+                    if idx not in self._part_blocks or idx in self._stale_parts:
+                        self._part_blocks[idx] = self._render_part_params(subpart)
+                    lines.append(self._part_blocks[idx])
+        self._stale_parts.clear()
+
+        self._preStartParams = 'preStartParams = function(){' + ''.join(lines) + '\n\n}'
+        return self._preStartParams
+
+    def _render_part_params(self, subpart):
+        ''' Renders the '$p[index].params(...)' line of a subpart '''
+        #print('SUBPART', subpart['params'])
+        subpart_params = filter_out_keys(subpart['params'])
+        if subpart_params == []:
+            self.logger.error('part parameters not imported')
+            raise ValueError('part parameters not imported')
+        idx = int(subpart['index'])
+        return f'\n    $p[{idx}].params({to_script_json(subpart_params)})'
 
     def create_preStartSelection(self, layers, parts):
         ''' Select the parts to be used '''
+        key = parts if parts == 'all' else tuple(parts) if isinstance(parts, (list, tuple)) else None
+        if key not in self._use_lines:
+            use_line = self._render_use_line(parts)
+            if key is None:
+                return self._selection(use_line, layers)
+            self._use_lines[key] = use_line
+        return self._selection(self._use_lines[key], layers)
+
+    def _selection(self, use_line, layers):
+        preStartSelection = f'preStartSelection = function(){"{"}'
+        preStartSelection += use_line
+        preStartSelection += f'\n    $p.select({layers[0]},{layers[1]})'
+        preStartSelection += f'\n{"}"}'
+        return preStartSelection
+
+    def _render_use_line(self, parts):
+        ''' Renders the '$p.use(...)' line (the same for every layer) '''
         if parts == 'all':
             try:
                 self.get_mapping_parts_to_index() #the only purpose of calling this function is to fill the list self.part_indices
@@ -280,11 +435,7 @@ class JobHandler:
                 self.logger.exception(f'Must give a list of ints for parts')
                 raise
 
-        preStartSelection = f'preStartSelection = function(){"{"}'
-        preStartSelection += f'\n    $p.use({parts})'
-        preStartSelection += f'\n    $p.select({layers[0]},{layers[1]})'
-        preStartSelection += f'\n{"}"}'
-        return preStartSelection
+        return f'\n    $p.use({parts})'
 
     def create_init_resume_script(self, layers, parts='all'):
         ''' Message to resume the execution of a script '''
@@ -310,76 +461,78 @@ class JobHandler:
             self.logger.info('enabling potentially hazardous mode where boundaries are ignored')
 
         global_params = self.job['params']
-
-        for i, parameter in enumerate(global_params):
-            if parameter['name'] == param:
-                #now we consider the cases of Int/Double Interval and bool
-                self.logger.info(f'before change: {param}={global_params[i]["value"]}')
-                if 'Interval' in parameter['type']:
-                    if 'intInterval' in parameter['type']:
-                        try:
-                            assert int(new_value) == new_value
-                        except:
-                            self.logger.exception(f'parameter {param}({new_value}) is not type int.')
-                            raise
-                    if 'doubleInterval' in parameter['type']:
-                        try:
-                            float(new_value)
-                        except:
-                            self.logger.exception(f'parameter {param}({new_value}) is not type double/float.')
-                            raise
-                    try:
-                        minimum = global_params[i]['value']['min']
-                        maximum = global_params[i]['value']['max']
-                        outside_bounds = new_value < minimum or new_value > maximum
-                        #print('outside bounds', outside_bounds)
-                        if check_boundaries and outside_bounds:
-                            corrected = min(max(minimum, new_value), maximum)
-                            msg = f'value of {param} must be in [{minimum}, ' \
-                                f'{maximum}], but received: {new_value}. Manually ' \
-                                f'setting it to {corrected}'
-                            new_value = corrected
-                            self.logger.warning(msg)
-                        elif outside_bounds:
-                            self.logger.info(f'The new value {new_value} of parameter {param} was supposed to lie between inside [{minimum},{maximum}], but since check_boundaries==False, no modification was made')
-                        global_params[i]['value']['value'] = new_value
-                        global_params[i]['dirty'] = True
-                    except TypeError:
-                        global_params[i]['value'] = new_value
-                        global_params[i]['dirty'] = True
-                        self.logger.warning(f'parameter {param} has no min and max values defined.')
-
-                elif parameter['type'] == 'bool':
-                    try:
-                        if new_value == 'True':
-                            new_value = True
-                        elif new_value == 'False':
-                            new_value = False
-                        assert(new_value is True or new_value is False)
-                    except:
-                        self.logger.exception(f'parameter {param} must be "True" or "False" (boolean), but received {new_value}, ({type(new_value)})')
-                        raise
-                    global_params[i]['value'] = new_value
-                    global_params[i]['dirty'] = True
-                elif parameter['type'] == 'double':
-                    try:
-                        new_value = float(new_value)
-                    except:
-                        self.logger.exception(f'parameter {param} must be set to a double value, but the value {new_value} could not be converted to double')
-                        raise
-                    global_params[i]['value'] = new_value
-                    global_params[i]['dirty'] = True
-                else:
-                    msg = f'{param} has type {parameter["type"]}. Must be IntInterval, DoubleInterval or bool'
-                    self.logger.error(msg)
-                    raise ValueError(msg)
-
-                self.logger.info(f'trying to set {param}={global_params[i]["value"]}')
-                break
-        else:
+        i = self._get_index()['global_params'].get(param)
+        if i is None:
             self.logger.error(f'parameter {param} is not found in global parameters!'
                           f' Are all parameters imported from the configuration?')
             raise ValueError
+        parameter = global_params[i]
+        old_value = parameter_value(parameter)
+
+        self._global_block = None # the global line is rendered again with the dirty parameter
+        #now we consider the cases of Int/Double Interval and bool
+        self.logger.info(f'before change: {param}={global_params[i]["value"]}')
+        if 'Interval' in parameter['type']:
+            if 'intInterval' in parameter['type']:
+                try:
+                    assert int(new_value) == new_value
+                except:
+                    self.logger.exception(f'parameter {param}({new_value}) is not type int.')
+                    raise
+            if 'doubleInterval' in parameter['type']:
+                try:
+                    float(new_value)
+                except:
+                    self.logger.exception(f'parameter {param}({new_value}) is not type double/float.')
+                    raise
+            try:
+                minimum = global_params[i]['value']['min']
+                maximum = global_params[i]['value']['max']
+                outside_bounds = new_value < minimum or new_value > maximum
+                #print('outside bounds', outside_bounds)
+                if check_boundaries and outside_bounds:
+                    corrected = min(max(minimum, new_value), maximum)
+                    msg = f'value of {param} must be in [{minimum}, ' \
+                        f'{maximum}], but received: {new_value}. Manually ' \
+                        f'setting it to {corrected}'
+                    new_value = corrected
+                    self.logger.warning(msg)
+                elif outside_bounds:
+                    self.logger.info(f'The new value {new_value} of parameter {param} was supposed to lie between inside [{minimum},{maximum}], but since check_boundaries==False, no modification was made')
+                global_params[i]['value']['value'] = new_value
+                global_params[i]['dirty'] = True
+            except TypeError:
+                global_params[i]['value'] = new_value
+                global_params[i]['dirty'] = True
+                self.logger.warning(f'parameter {param} has no min and max values defined.')
+
+        elif parameter['type'] == 'bool':
+            try:
+                if new_value == 'True':
+                    new_value = True
+                elif new_value == 'False':
+                    new_value = False
+                assert(new_value is True or new_value is False)
+            except:
+                self.logger.exception(f'parameter {param} must be "True" or "False" (boolean), but received {new_value}, ({type(new_value)})')
+                raise
+            global_params[i]['value'] = new_value
+            global_params[i]['dirty'] = True
+        elif parameter['type'] == 'double':
+            try:
+                new_value = float(new_value)
+            except:
+                self.logger.exception(f'parameter {param} must be set to a double value, but the value {new_value} could not be converted to double')
+                raise
+            global_params[i]['value'] = new_value
+            global_params[i]['dirty'] = True
+        else:
+            msg = f'{param} has type {parameter["type"]}. Must be IntInterval, DoubleInterval or bool'
+            self.logger.error(msg)
+            raise ValueError(msg)
+
+        self.logger.info(f'trying to set {param}={global_params[i]["value"]}')
+        self.changes.append(('global', param, old_value, parameter_value(parameter)))
 
     def change_part_parameter(self, part_id, param, new_value, laser = '*', check_boundaries=True):
         ''' Function to build parameters for individual parts '''
@@ -393,107 +546,116 @@ class JobHandler:
             if laser not in laser_list:
                 raise ValueError(f'Cant select laser {laser}. choices: {laser_list}')
 
-        partRefs = self.job['partRefs']
-
-        for partRef in partRefs: #main parts
-            for subpart in partRef['subparts']: #sub parts
-                if int(subpart['index']) == int(part_id): #we found our part
-                    #print('FOUND:', param, partRef['name'], subpart['name'])
-
-                    found_laser = False
-                    found_param = False
-                    for i, parameter in enumerate(subpart['params']):
-                        if parameter['name'] == 'scanner':
-                            found_laser = True
-                            if laser != '*':
-                                self.logger.info(f'Changing laser from {parameter["value"]} to {laser}')
-                                parameter['value'] = laser
-                                parameter['dirty'] = True
-                                #ignore parameter['force']
-                        if parameter['name'] != param:
-                            continue
-                        #now we consider the cases of Int/Double Interval and bool
-                        found_param = True
-                        if 'Interval' in parameter['type']:
-                            if 'intInterval' in parameter['type']:
-                                try:
-                                    assert int(new_value) == new_value
-                                    new_value = int(new_value)
-                                except:
-                                    self.logger.exception(f'parameter {param}({new_value}) is not type int.')
-                                    raise
-                            if 'doubleInterval' in parameter['type']:
-                                try:
-                                    new_value = float(new_value)
-                                except:
-                                    self.logger.exception(f'parameter {param}({new_value}) is not type double/float.')
-                                    raise
-
-                            self.logger.info(f'param {param} before change: {partRef["name"]}, {subpart["name"]}, {subpart["params"][i]["value"]["value"]}')
-                            try:
-                                minimum = subpart['params'][i]['value']['min']
-                                maximum = subpart['params'][i]['value']['max']
-
-                                outside_bounds = new_value < minimum or new_value > maximum
-                                if check_boundaries and outside_bounds:
-                                        correction = min(max(minimum, new_value), maximum)
-                                        msg = f'value of {param} must be in [{minimum}, ' \
-                                            f'{maximum}], but received: {new_value}. Manually ' \
-                                            f'setting it to {correction}'
-                                        new_value = correction
-                                        self.logger.warning(msg)
-                                elif outside_bounds:
-                                        self.logger.info(f'The new value {new_value} of parameter {param} was supposed to lie between inside [{minimum},{maximum}], but since check_boundaries==False, no modification was made')
-
-                                subpart['params'][i]['value']['value'] = new_value
-                                subpart['params'][i]['dirty'] = True
-                                self.logger.info(f'trying to set: {partRef["name"]}, {subpart["name"]}, {subpart["params"][i]["value"]["value"]}')
-                            except TypeError:
-                                subpart['params'][i]['value'] = new_value
-                                subpart['params'][i]['dirty'] = True
-                                self.logger.warning(f'parameter {param} has no min and max values defined.')
-                                self.logger.info(f'trying to set  {partRef["name"]}, {subpart["name"]}, {subpart["params"][i]["value"]}')
-
-
-
-                            # COLOR
-                            #subpart['params'][i]['color'] = "#0000ff" #cyan -> python client shall not be bothered with colors.
-                            # SYNC -> ignore subpart['params'][i]['sync'] completely. It is not used anywhere anymore.
-
-                        elif parameter['type'] == 'bool':
-                            try:
-                                if new_value == 'True':
-                                    new_value = True
-                                elif new_value == 'False':
-                                    new_value = False
-                                assert(new_value is True or new_value is False)
-                            except:
-                                self.logger.exception(f'parameter {param} must be "True" or "False" (boolean), but received {new_value}, ({type(new_value)})')
-                                raise
-                            subpart['params'][i]['value'] = new_value
-                            subpart['params'][i]['dirty'] = True
-                        elif parameter['type'] == 'double':
-                            try:
-                                new_value = float(new_value)
-                            except:
-                                self.logger.exception(f'parameter {param} must be set to a double value, but the value {new_value} could not be converted to double')
-                                raise
-                            subpart['params'][i]['value'] = new_value
-                            subpart['params'][i]['dirty'] = True
-                        else:
-                            msg = f'{param} has type {parameter["type"]}. Only the cases IntInterval, DoubleInterval or bool get processed here.'
-                            self.logger.error(msg)
-                            raise ValueError(msg)
-                    #for p in subpart['params']:
-                    #    print(json.dumps(p, indent=3))
-                    if not found_param:
-                        self.logger.error(f'parameter {param} not found in parameters')
-                        raise ValueError(f'parameter {param} not found in parameters')
-                    else:
-                        return
-
-        self.logger.error(f'part id {part_id} does not exist')
-        raise ValueError(f'part id {part_id} does not exist')
+        index = self._get_index()
+        part_id = int(part_id)
+        if part_id not in index['parts']:
+            self.logger.error(f'part id {part_id} does not exist')
+            raise ValueError(f'part id {part_id} does not exist')
+        partRef, subpart = index['parts'][part_id]
+        self._stale_parts.add(part_id) # only this part line is rendered again
+
+        if laser != '*':
+            for parameter in index['part_params'].get((part_id, 'scanner'), []):
+                self.logger.info(f'Changing laser from {parameter["value"]} to {laser}')
+                self.changes.append((part_id, 'scanner', parameter['value'], laser))
+                parameter['value'] = laser
+                parameter['dirty'] = True
+                #ignore parameter['force']
+
+        parameters = index['part_params'].get((part_id, param))
+        if not parameters:
+            self.logger.error(f'parameter {param} not found in parameters')
+            raise ValueError(f'parameter {param} not found in parameters')
+        for parameter in parameters:
+            old_value = parameter_value(parameter)
+            new_value = self._set_part_parameter(partRef, subpart, parameter, param, new_value, check_boundaries)
+            self.changes.append((part_id, param, old_value, parameter_value(parameter)))
+
+    def change_part_parameters(self, changes, laser = '*', check_boundaries=True):
+        '''
+        Changes many part parameters at once.
+
+        :param changes: {part_id: {param: value}}, for example {4: {'laser_power': 150.0, 'mark_speed': 900.0}}
+        :type changes: dict
+        '''
+        for part_id, params in changes.items():
+            for param, new_value in params.items():
+                self.change_part_parameter(part_id, param, new_value, laser, check_boundaries)
+
+    def _set_part_parameter(self, partRef, subpart, parameter, param, new_value, check_boundaries):
+        ''' Sets the value of one part parameter. Returns the value which was set. '''
+        #now we consider the cases of Int/Double Interval and bool
+        if 'Interval' in parameter['type']:
+            if 'intInterval' in parameter['type']:
+                try:
+                    assert int(new_value) == new_value
+                    new_value = int(new_value)
+                except:
+                    self.logger.exception(f'parameter {param}({new_value}) is not type int.')
+                    raise
+            if 'doubleInterval' in parameter['type']:
+                try:
+                    new_value = float(new_value)
+                except:
+                    self.logger.exception(f'parameter {param}({new_value}) is not type double/float.')
+                    raise
+
+            self.logger.info(f'param {param} before change: {partRef["name"]}, {subpart["name"]}, {parameter["value"]["value"]}')
+            try:
+                minimum = parameter['value']['min']
+                maximum = parameter['value']['max']
+
+                outside_bounds = new_value < minimum or new_value > maximum
+                if check_boundaries and outside_bounds:
+                        correction = min(max(minimum, new_value), maximum)
+                        msg = f'value of {param} must be in [{minimum}, ' \
+                            f'{maximum}], but received: {new_value}. Manually ' \
+                            f'setting it to {correction}'
+                        new_value = correction
+                        self.logger.warning(msg)
+                elif outside_bounds:
+                        self.logger.info(f'The new value {new_value} of parameter {param} was supposed to lie between inside [{minimum},{maximum}], but since check_boundaries==False, no modification was made')
+
+                parameter['value']['value'] = new_value
+                parameter['dirty'] = True
+                self.logger.info(f'trying to set: {partRef["name"]}, {subpart["name"]}, {parameter["value"]["value"]}')
+            except TypeError:
+                parameter['value'] = new_value
+                parameter['dirty'] = True
+                self.logger.warning(f'parameter {param} has no min and max values defined.')
+                self.logger.info(f'trying to set  {partRef["name"]}, {subpart["name"]}, {parameter["value"]}')
+
+
+
+            # COLOR
+            #parameter['color'] = "#0000ff" #cyan -> python client shall not be bothered with colors.
+            # SYNC -> ignore parameter['sync'] completely. It is not used anywhere anymore.
+
+        elif parameter['type'] == 'bool':
+            try:
+                if new_value == 'True':
+                    new_value = True
+                elif new_value == 'False':
+                    new_value = False
+                assert(new_value is True or new_value is False)
+            except:
+                self.logger.exception(f'parameter {param} must be "True" or "False" (boolean), but received {new_value}, ({type(new_value)})')
+                raise
+            parameter['value'] = new_value
+            parameter['dirty'] = True
+        elif parameter['type'] == 'double':
+            try:
+                new_value = float(new_value)
+            except:
+                self.logger.exception(f'parameter {param} must be set to a double value, but the value {new_value} could not be converted to double')
+                raise
+            parameter['value'] = new_value
+            parameter['dirty'] = True
+        else:
+            msg = f'{param} has type {parameter["type"]}. Only the cases IntInterval, DoubleInterval or bool get processed here.'
+            self.logger.error(msg)
+            raise ValueError(msg)
+        return new_value
 
 def get_adress(args):
     ''' Return the address of the machine '''
@@ -558,6 +720,68 @@ def get_time_string(raw_time_stamp, format ='%b %d %H:%M:%S'):
     return time_string
 
 
+def get_command_counts(msg):
+    '''
+    Returns the command counts of a cmds report (for example {'AddLayerCommand': 3}).
+    Returns None if the message is no cmds report.
+    '''
+    if msg.get('topic') != 'cmds' or 'data' not in msg:
+        return None
+    for data in msg['data']:
+        if 'name' in data and 'value' in data and data['name'] == 'report':
+            value = decode_ws_msg(data['value'])
+            if 'counts' in value:
+                return value['counts']
+    return None
+
+def find_command_counts(data):
+    '''
+    Searches a server answer (e.g. of the route script) for command counts like {'AddLayerCommand': 3}.
+    Returns None if there are none.
+    '''
+    if isinstance(data, dict):
+        counts = data.get('counts')
+        if isinstance(counts, dict) and 'AddLayerCommand' in counts:
+            return counts
+        values = data.values()
+    elif isinstance(data, list):
+        values = data
+    else:
+        return None
+    for value in values:
+        counts = find_command_counts(value)
+        if counts is not None:
+            return counts
+    return None
+
+def get_signals(msg):
+    '''
+    Returns a dictionary {signal: value} of the numeric values in a websocket message.
+    Every entry of msg['data'] with a numeric 'value' is interpreted as the value of the
+    signal given by its 'cid' (or 'name'), for example {"cid": "slider", "value": 105.0}.
+    '''
+    signals = {}
+    data = msg.get('data') if isinstance(msg, dict) else None
+    if not isinstance(data, list):
+        return signals
+    for entry in data:
+        if not isinstance(entry, dict):
+            continue
+        signal = entry.get('cid', entry.get('name'))
+        try:
+            signals[signal] = float(entry['value'])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return signals
+
+def get_positions(msg):
+    '''
+    Returns a dictionary {axis: position} of a Positioning message, see get_signals.
+    '''
+    if msg.get('topic') != 'Positioning':
+        return {}
+    return get_signals(msg)
+
 def track_layer_number(client, msg):
     ''' Update the current layer class attribute '''
     if 'topic' in msg and msg['topic'] == 'cmds' and 'data' in msg:
@@ -1,2 +1,5 @@
 from .AconitySTUDIO_client import *
 from .AconitySTUDIO_utils import *
+from .AconitySTUDIO_events import *
+from .AconitySTUDIO_database import *
+from .AconitySTUDIO_telemetry import *
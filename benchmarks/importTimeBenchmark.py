@@ -0,0 +1,62 @@
+# Startup-time benchmark | Importing executeScript must only cost Python import time.
+# Imports executeScript in fresh interpreters, reports the import time and fails if it is above the budget
+# or if a hardware driver (VISA, NI-DAQmx, serial pump, keyboard hook) got loaded during the import.
+#
+# Usage: python benchmarks/importTimeBenchmark.py [--runs 5] [--budget 1.0] [--output result.json]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HARDWARE_MODULES = ['pyvisa', 'nidaqmx', 'nesp_lib', 'serial', 'keyboard']
+
+# runs inside the fresh interpreter
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import executeScript
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'hardware': [m for m in %r if m in sys.modules]}))
+''' % (HARDWARE_MODULES,)
+
+def importOnce():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT, os.path.join(ROOT, 'aconityAPIfiles'), env.get('PYTHONPATH', '')])
+    result = subprocess.run([sys.executable, '-c', PROBE], cwd = ROOT, env = env, capture_output = True, text = True)
+    if result.returncode != 0:
+        print(result.stderr)
+        raise RuntimeError('importing executeScript failed')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Measure the import time of executeScript.')
+    parser.add_argument('--runs', type = int, default = 5)
+    parser.add_argument('--budget', type = float, default = 1.0, help = 'maximum median import time in seconds')
+    parser.add_argument('--output', help = 'write the result as json to this file')
+    args = parser.parse_args()
+
+    runs = [importOnce() for _ in range(args.runs)]
+    times = [run['seconds'] for run in runs]
+    hardware = sorted({module for run in runs for module in run['hardware']})
+    result = {
+        'runs': args.runs,
+        'median_s': statistics.median(times),
+        'max_s': max(times),
+        'budget_s': args.budget,
+        'hardware_modules_imported': hardware,
+    }
+    print(json.dumps(result, indent = 3))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(result, file, indent = 3)
+
+    if hardware:
+        sys.exit(f'importing executeScript loaded hardware drivers: {hardware}')
+    if result['median_s'] > args.budget:
+        sys.exit(f'import took {result["median_s"]:.3f} s, budget is {args.budget} s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+# PILM layer-cycle benchmark | Runs multiLayerPILMFun-equivalent layer cycles against simulated hardware
+# (AconitySTUDIO simulator, pyvisa-sim PSU, simulated DAQ dispenser) and reports the wall time of every stage,
+# the per-layer totals (p50/p95/max) and how long the event loop was blocked.
+#
+# Usage: python benchmarks/layerCycleBenchmark.py [--layers 5] [--drying-time 2] [--sequential] [--output result.json]
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'aconityAPIfiles')]
+
+import executeScript
+import pilmRecipe
+import powerSupplyControls
+import syringeDispenseControls
+from AconitySTUDIO_simulator import AconitySTUDIO_simulator
+
+PSU_SIMULATION = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dp800_sim.yaml') + '@sim'
+
+#----Simulated hardware----#
+# Same interface as syringeDispenseControls.DispenseController, the trigger is only timed
+class SimulatedDispenser:
+    def __init__(self, preTriggerTime = 1.0, triggerTime = 3.0):
+        self.preTriggerTime = preTriggerTime
+        self.triggerTime = triggerTime
+        self._armed = None
+
+    async def arm(self, preTrigger = True):
+        self._armed = preTrigger
+
+    async def disarm(self):
+        self._armed = None
+
+    async def release(self):
+        if self._armed is None:
+            await self.arm()
+        if self._armed:
+            await asyncio.sleep(self.preTriggerTime)
+        self._armed = None
+        releaseTime = time.perf_counter()
+        await asyncio.sleep(self.triggerTime)
+        return releaseTime
+
+    async def dispense(self):
+        await self.arm()
+        return await self.release()
+
+#----Measurements----#
+# Records start and end of every step | steps of the same layer can run at the same time, the layer total is the time
+# from its first step starting to its last step ending
+class StageTimer:
+    def __init__(self):
+        self.spans = {} # layer -> {stage: (start, end)}
+
+    @contextmanager
+    def stage(self, step):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.setdefault(step.layer, {})[step.stage] = (start, time.perf_counter())
+
+    def results(self, schedule):
+        layers = []
+        for plan in schedule.layers:
+            spans = self.spans.get(plan.layer)
+            if not spans:
+                continue
+            first = spans[plan.steps[0].stage][0] # the dispense trigger of the next layer is armed early, that doesn't count
+            layers.append({
+                'layer': plan.layer,
+                'stages': {stage: end - start for stage, (start, end) in spans.items()},
+                'total_s': max(end for start, end in spans.values()) - first,
+            })
+        return layers
+
+# Measures how late asyncio.sleep wakes up | Late wake-ups mean something blocked the event loop
+class EventLoopMonitor:
+    def __init__(self, interval = 0.01, threshold = 0.005):
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked = 0.0
+        self.maxLag = 0.0
+        self.stalls = 0
+
+    async def run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - start - self.interval
+            self.maxLag = max(self.maxLag, lag)
+            if lag > self.threshold:
+                self.blocked += lag
+                self.stalls += 1
+
+def summary(values):
+    values = sorted(values)
+    rank = lambda q: values[min(len(values) - 1, max(0, int(round(q * len(values) + 0.5)) - 1))]
+    return {
+        'n': len(values),
+        'mean_s': statistics.fmean(values),
+        'p50_s': rank(0.50),
+        'p95_s': rank(0.95),
+        'max_s': values[-1],
+    }
+
+#----Layer cycle----#
+# The schedule of the default recipe, shortened to the benchmark settings
+def benchmarkSchedule(args):
+    recipe = pilmRecipe.loadRecipe(args.recipe)
+    job = recipe['job']
+    job['endLayer'] = job['startLayer'] + args.layers - 1
+    recipe['drying']['time'] = args.drying_time
+    recipe['dispense'] = {key: value * args.time_scale for key, value in recipe['dispense'].items() if not key.startswith('_')}
+    recipe['layers'] = [] # the per-layer settings of the recipe are for the real build
+    return pilmRecipe.compileRecipe(recipe)
+
+# Same steps as executeScript.multiLayerPILMFun, each one timed
+async def layerCycles(client, timer, schedule, sequential = False):
+    await executeScript.runSchedule(client, schedule.steps(), stage = timer.stage, sequential = sequential)
+
+async def benchmark(args):
+    simulator = AconitySTUDIO_simulator(rest_latency = args.rest_latency, ws_latency = args.ws_latency,
+                                        layer_time = args.layer_time, time_scale = args.time_scale)
+    await simulator.start(port = 0)
+
+    powerSupplyControls.setPowerSupply(powerSupplyControls.PowerSupply(visaLibrary = PSU_SIMULATION))
+    syringeDispenseControls.setDispenser(SimulatedDispenser())
+    schedule = benchmarkSchedule(args)
+
+    monitor = EventLoopMonitor()
+    monitorTask = asyncio.create_task(monitor.run())
+    timer = StageTimer()
+    start = time.perf_counter()
+    try:
+        client = await executeScript.AconitySTUDIOPythonClient.create(simulator.login_data())
+        client.studio_version = 2
+        async with client:
+            await client.resolve_ids(simulator.jobs[next(iter(simulator.jobs))]['name'], simulator.machine['name'],
+                                     simulator.config['name'])
+            await layerCycles(client, timer, schedule, args.sequential)
+            await client.stop_job()
+    finally:
+        monitorTask.cancel()
+        await simulator.stop()
+    wallTime = time.perf_counter() - start
+
+    layers = timer.results(schedule)
+    stageNames = sorted({name for layer in layers for name in layer['stages']})
+    return {
+        'config': vars(args),
+        'wall_time_s': wallTime,
+        'estimated_s': schedule.estimate(args.sequential),
+        'layers': layers,
+        'stages': {name: summary([layer['stages'][name] for layer in layers if name in layer['stages']]) for name in stageNames},
+        'layer_total': summary([layer['total_s'] for layer in layers]),
+        'event_loop': {'blocked_s': monitor.blocked, 'max_lag_s': monitor.maxLag, 'stalls': monitor.stalls},
+        'dispense_skew': executeScript.dispenseSkew,
+        'http_requests': simulator.requests,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark PILM layer cycles against simulated hardware.')
+    parser.add_argument('--recipe', default = pilmRecipe.DEFAULT_RECIPE)
+    parser.add_argument('--layers', type = int, default = 5)
+    parser.add_argument('--drying-time', type = int, default = 2, help = 'seconds of drying per layer')
+    parser.add_argument('--layer-time', type = float, default = 1.0, help = 'simulated sintering time per layer')
+    parser.add_argument('--time-scale', type = float, default = 0.1, help = 'factor for simulated move durations and the dispense times of the recipe')
+    parser.add_argument('--rest-latency', type = float, default = 0.005)
+    parser.add_argument('--ws-latency', type = float, default = 0.002)
+    parser.add_argument('--sequential', action = 'store_true', help = 'run one step at a time instead of overlapping independent hardware')
+    parser.add_argument('--output', help = 'write the result as json to this file')
+    args = parser.parse_args()
+
+    result = asyncio.run(benchmark(args))
+    print(json.dumps({key: result[key] for key in ('wall_time_s', 'stages', 'layer_total', 'event_loop')}, indent = 3))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(result, file, indent = 3)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# Script serialization benchmark | Renders the parameter blocks of a synthetic job with many parts, compares the
+# JSON serializer (utils.to_script_json) with the old repr + string replace conversion, and checks that
+#   - the rendered parameters parse back to exactly the job parameters (round trip),
+#   - for parameters without spaces, quotes or None the output is identical to the old one, which AconitySTUDIO accepts,
+#   - string values with spaces, quotes and 'True' survive (the old conversion corrupted them),
+#   - int keys and NaN give the same result with and without orjson.
+# Fails if one of the checks fails.
+#
+# Usage: python benchmarks/scriptSerializationBenchmark.py [--parts 500] [--repeat 20] [--output result.json]
+import argparse
+import copy
+import json
+import logging
+import os
+import re
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'aconityAPIfiles')]
+
+import AconitySTUDIO_utils as utils
+from AconitySTUDIO_simulator import make_job
+
+PARAMS_PATTERN = re.compile(r'\$(?:g|p\[(\d+)\])\.params\((.*)\)$')
+
+# The conversion used before to_script_json
+def legacyScriptJson(data):
+    data = f'{data}'
+    data = data.replace('False','false')
+    data = data.replace('True','true')
+    data = data.replace(' ', '')
+    return data.replace("'",'"')
+
+def timeIt(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {'median_s': statistics.median(times), 'min_s': min(times)}
+
+# Parses a preStartParams block back to {None: global params, part index: part params}
+def parseParams(preStartParams):
+    parsed = {}
+    for line in preStartParams.splitlines():
+        match = PARAMS_PATTERN.match(line.strip())
+        if match:
+            parsed[int(match.group(1)) if match.group(1) else None] = json.loads(match.group(2))
+    return parsed
+
+def expectedParams(job):
+    expected = {None: job['params']}
+    for partRef in job['partRefs']:
+        if '[all]' not in partRef['name']:
+            for subpart in partRef['subparts']:
+                expected[int(subpart['index'])] = utils.filter_out_keys(subpart['params'])
+    return expected
+
+def check(condition, message, failures):
+    if not condition:
+        failures.append(message)
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark and check the serialization of AconityScript parameters.')
+    parser.add_argument('--parts', type = int, default = 500)
+    parser.add_argument('--repeat', type = int, default = 20)
+    parser.add_argument('--output', help = 'write the result as json to this file')
+    args = parser.parse_args()
+
+    logger = logging.getLogger('scriptSerializationBenchmark')
+    job = make_job('benchmark_job', args.parts)
+    params = [utils.filter_out_keys(subpart['params']) for partRef in job['partRefs'] for subpart in partRef['subparts']]
+    failures = []
+
+    # round trip and compatibility with the old output
+    handler = utils.JobHandler(copy.deepcopy(job), logger, 2)
+    check(parseParams(handler.create_preStartParams()) == expectedParams(job), 'preStartParams does not parse back to the job parameters', failures)
+    check(all(utils.to_script_json(p) == legacyScriptJson(p) for p in params), 'output differs from the old conversion for plain parameters', failures)
+
+    # values the old conversion corrupted
+    tricky = copy.deepcopy(job)
+    tricky['params'].append({'name': 'comment', 'type': 'string', 'value': "it's True that a b", 'dirty': False})
+    subpart = next(partRef for partRef in tricky['partRefs'] if '[all]' not in partRef['name'])['subparts'][0]
+    subpart['params'].append({'name': 'label', 'type': 'string', 'value': 'say "hi" False', 'dirty': False})
+    subpart['params'].append({'name': 'unset', 'type': 'double', 'value': None, 'dirty': False})
+    check(parseParams(utils.JobHandler(tricky, logger, 2).create_preStartParams()) == expectedParams(tricky),
+          'strings with spaces/quotes/True or None values do not survive', failures)
+
+    # same output with and without orjson: int keys become strings, NaN is rejected
+    intKeys = {1: 'a', 2: [{'value': 3.5}]}
+    check(json.loads(utils.to_script_json(intKeys)) == {str(key): value for key, value in intKeys.items()},
+          'int keys do not parse back as string keys', failures)
+    check(utils.to_script_json(intKeys) == json.dumps(intKeys, separators = (',', ':')), 'int keys differ from json', failures)
+    try:
+        utils.to_script_json([{'value': float('nan')}])
+        failures.append('NaN is not rejected')
+    except ValueError:
+        pass
+
+    # speed
+    def render():
+        handler.clear_cache()
+        handler.create_preStartParams()
+    result = {
+        'parts': args.parts,
+        'orjson': utils.orjson is not None,
+        'serialize_all_parts': {
+            'to_script_json': timeIt(lambda: [utils.to_script_json(p) for p in params], args.repeat),
+            'legacy': timeIt(lambda: [legacyScriptJson(p) for p in params], args.repeat),
+        },
+        'render_preStartParams': timeIt(render, args.repeat),
+        'failures': failures,
+    }
+    print(json.dumps(result, indent = 3))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(result, file, indent = 3)
+    if failures:
+        sys.exit('\n'.join(failures))
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,9 @@
 # -- Importing Libraries and Files -- # 
 import asyncio # for AconityStudio Integration
+import contextlib
 import os # to clear and clean console
 import sys # to exit out of program when needed
 import time # time delays
-import keyboard # for keyboard inputs | For PSU with Stopwatch
 import signal 
 signal.signal(signal.SIGINT, signal.SIG_DFL)
 
@@ -12,112 +12,28 @@ from AconitySTUDIO_client import AconitySTUDIOPythonClient
 from AconitySTUDIO_client import utils
 
 # import PSU control functions and Syringe Dispense control functions
+# (the devices are only connected on first use, importing this script does not touch the USB bus | see benchmarks/importTimeBenchmark.py)
 from powerSupplyControls import timerFunction, MutipleChannels_StopWatch, heatPadOneChannel, heatPadMutipleChannels
-from syringeDispenseControls import PILMDispenseOperation
-#------------------------------------------------------------------------------------#
-
-
-# ----------- Initial Variables and Scripts ----------- # 
-
-# --- Slider Movement Variables And AconityScripts --- #
-
-# default positions for SLIDER 
-positiveEndPos = "300"
-centerPos = "300"
-platformInFrontPos = "210"
-platformRearPos = "30"
-
-# Slot-die + Slider Positions
-start_postion = "105"
-end_position = "145"
-
-# AconityScripts for SLIDER
-slotDieStartPos = f'$m.move_abs($c[slider], {start_postion},100)' # move slider to first pos of deposition process
-slotDieEndPos = f'$m.move_abs($c[slider], {end_position},10)' # move slider to final pos of deposition process | Get's called with the syringe operation function
-centerPos_Slider = f'$m.move_abs($c[slider],{centerPos},100)' # this will be used to move slider away from the laser during the sintering process | Default Pos too
-centerPos_Temp = f'$m.move_abs($c[slider],{centerPos},0.37)' # temporary test
- 
-
-# --- Platform Movement Variables And AconityScripts --- #
-
-# Platform variables for Multi-Layer PILM Process
-defaultHeight = "17.90" # default height of the platform from the start, adjust when needed
-PILM_Loop = 0 # keep count of the total PILM iterations
-layerThickness = 0.20 # adjust platform for desired layer thickness for each iteration
-platformIncrementUp = -2.00 + layerThickness
-platfromDecrementDown = 2.00
-
-# AconityScript for PLATFORM Movement
-defaultPlatformHeight = f'$m.move_abs($c[platform],{defaultHeight}, 100)'
-slotDiePlatFormHeight_UP = f'$m.move_rel($c[platform],{platformIncrementUp},100)' #
-slotDiePlatFormHeight_DOWN = f'$m.move_rel($c[platform],{platfromDecrementDown},100)'
+from syringeDispenseControls import getDispenser
 
+from pilmRecipe import DEFAULT_RECIPE, loadRecipe, compileRecipe, formatTime
+from stageScheduler import runSteps
 #------------------------------------------------------------------------------------#
 
-# --- Execution Scripts and Variables for Single and Multi-Layer Process --- #
-
-#--- Includes scripts for Single and Multi-Layer Sintering ---#
 
-singleLayerSinter = \
-'''layer= function(){
-for(p:$p){
-    $m.expose(p[next;$h],$c[scanner_1])
-}
-  $m.inc_h($g)
-}
-
-repeat(layer)'''
-
-# Will not repeat the same layer. Example: If its from layers 1 to 10, the first iteration will be layers 1 and 2.
-# It will not be layer 1 and then layer 1 again.
-doubleLayerSinter = \
-'''
-layer = function(){
-    for(p:$p){
-        $m.expose(p[next;$h],$c[scanner_1])
-    }
-    $m.inc_h($g)
-}
-  
-repeat(2,layer)
-
-'''
-
-
-
-multiLayerSinter = \
-'''layer = function(){
-    for(p:$p){
-        $m.expose(p[next;$h],$c[scanner_1])
-    }
-    $m.inc_h($g)
-}
-
-repeat(3,layer)'''
-
-
-sinterConfigs = {
-      'single_Layer' : singleLayerSinter,
-      'double_Layer' : doubleLayerSinter,
-      'multi_Layer' :  multiLayerSinter
-      
-}
-
-# Job Configurations | Select layers and sinter config here
-execution_script = sinterConfigs['single_Layer'] # Select the configuration for laser sintering here.
-build_parts = 'all' # Don't change. Wily
-# select all the existing parts within a job for the sintering process.
-start_layer = 8
-end_layer = 8
-currentLayer = start_layer # Used to tell the current layer within the single and multi-layer process.
-initalLayer = start_layer # This is only ever used in the multi layer, but only once
+# ----------- Recipe ----------- # 
 
+# Positions, speeds, dispense, drying and sintering of the build are set in the recipe (see pilmRecipe.py).
+# The recipe is compiled once into a schedule, every AconityScript is built before the machine moves.
+# Check a recipe and its estimated build time with: python pilmRecipe.py -v recipes/defaultRecipe.json
+RECIPE_FILE = DEFAULT_RECIPE
 
+dispenseSkew = [] # measured start skew of every layer in s: {'commandToMotion': ..., 'motionToTrigger': ...}
 
 #-----------------------------------------------------------------------------------#
 
 
-async def executeFunc(login_data, info): # main function to call for the PILM process
+async def executeFunc(login_data, info, schedule): # main function to call for the PILM process
     
     # create client with factory method
      client = await AconitySTUDIOPythonClient.create(login_data)
@@ -126,21 +42,20 @@ async def executeFunc(login_data, info): # main function to call for the PILM pr
     # IMPORTANT:
     # the following CONVENIENCE FUNCTIONS (get_job_id etc) only work if the job_name, machine_name or config_name are unique.
     # If this is not the case, set the attributes job_name, config_name, machine_name manually
-     await client.get_job_id(info['job_name'])
-     await client.get_machine_id(info['machine_name'])
-     await client.get_config_id(info['config_name'])
+    # The three lookups run at the same time, the ids are cached in login_data['id_cache_file'] for the next run
+     await client.resolve_ids(info['job_name'], info['machine_name'], info['config_name'])
      
 
      os.system('cls' if os.name == 'nt' else 'clear') # Clear everything above this code | To get rid of clutter
-    #  await check_List()
-    #  await client.start_job(execution_script = execution_script,layers = [start_layer, end_layer],parts = build_parts) 
-     await singleLayerPILMFunc(client)
-    # await multiLayerPILMFun(client, currentLayer, PILM_Loop, platformIncrementUp)
+    #  await check_List(info, schedule)
+     await singleLayerPILMFunc(client, schedule)
+    # await multiLayerPILMFun(client, schedule)
 
 #------------------------------------------------------------------------------------#
-async def check_List():   
+async def check_List(info, schedule):   
  checkListApproved = False
  userInput = ' '
+ recipe = schedule.recipe
  
  print("\nChecklist Before PILM Process")
  print("============================\n")
@@ -154,12 +69,16 @@ async def check_List():
     
  print("Layer Configuration")
  print("-------------------\n")
- print(f"Start Layer: {start_layer}")
- print(f"End Layer: {end_layer}")
- print(f"Starting Platform Height: {defaultHeight}")
- print(f"Layer Thickness: {layerThickness}")
- print(f"platformIncrementUp: {platformIncrementUp}")
- print(f"platformDecrementDown: {platfromDecrementDown}\n")   
+ print(f"Start Layer: {schedule.startLayer}")
+ print(f"End Layer: {schedule.endLayer}")
+ print(f"Starting Platform Height: {recipe['platform']['defaultHeight']}")
+ print(f"Layer Thickness: {recipe['platform']['layerThickness']}")
+ print(f"Platform Lift: {recipe['platform']['lift']}\n")
+
+ print("Plan")
+ print("----\n")
+ schedule.printPlan()
+ print()
 
  while checkListApproved != True:       
   print("Are you okay with this? Y or N")
@@ -181,106 +100,108 @@ async def check_List():
  
 # -------------------------------------------------------------------------------------------------------------#
 
-# Function for slot-die dispensing process 
-async def dispenseFunction(client):
-    await client.execute(channel = 'manual_move', script = slotDieEndPos)
-    await PILMDispenseOperation()
-    
-    
-async def multiLayerPILMFun(client, currentLayer, PILM_Loop, platformIncrementUp):
-    # things to do before loop statement
-    await client.execute(channel = 'manual_move', script = defaultPlatformHeight)
-    PILM_Loop += 1 # Start on the first PILM Loop
-    
+# Moves an axis and returns once it reached the target
+async def moveFunction(client, step):
+    await client.execute(channel = step.channel, script = step.script)
+    return await client.wait_for_position(step.axis, step.target, timeout = step.timeout)
+
+# Prepares the dispense trigger | runs once the axes are in position (see pilmRecipe.compileRecipe)
+async def armFunction(client, step):
+    dispenser = getDispenser()
+    dispenser.preTriggerTime = step.options['preTriggerTime']
+    dispenser.triggerTime = step.options['triggerTime']
+    await dispenser.arm(preTrigger = False)
+
+# Function for slot-die dispensing process | The trigger is armed before the slider moves and released once the slider starts moving
+async def dispenseFunction(client, step):
+    dispenser = getDispenser()
+
+    commandTime = time.perf_counter()
+    move = asyncio.create_task(client.execute(channel = step.channel, script = step.script))
+    try:
+        motionTime = await client.wait_for_motion(step.axis, step.origin, step.options['motionThreshold'], timeout = step.timeout)
+        releaseTime = await dispenser.release() # None if the trigger line released it
+    except BaseException: # timeout or cancelled | the armed trigger must not fire later
+        move.cancel()
+        await dispenser.disarm()
+        raise
+    await move
+
+    skew = {'commandToMotion': motionTime - commandTime,
+            'motionToTrigger': None if releaseTime is None else releaseTime - motionTime}
+    dispenseSkew.append(skew)
+    print(f"Dispense skew: {skew}")
+    await client.wait_for_position(step.axis, step.target, timeout = step.timeout) # the ink is on the substrate once the slider reached the end position
+
+# Substrate drying | the slider moves back to the center at the same time (see stageScheduler.py)
+async def dryingFunction(client, step):
+    await heatPadMutipleChannels(**step.options)
+
+# Function for the sintering of one layer
+async def sinterFunction(client, step):
+    options = step.options
+    # subscribe to the channel before starting, so the start of the job can not be missed
+    with client.bus.subscribe('run', step.channel) as run:
+        if options['first']:
+            await client.start_job(execution_script = options['executionScript'], layers = options['layers'], parts = options['parts'], channel_id = step.channel)
+        else:
+            await client.resume_job(channel_id = step.channel) # resume the job, but at the next layer | inital is 7, then this will start at layer 8
+        try:
+            await client.wait_for_channel(step.channel, events = ('started', 'resumed'), timeout = options['startTimeout'], subscription = run)
+        except asyncio.TimeoutError:
+            print(f"No start of the job reported on {step.channel}. Pausing anyway.")
+
+        if options['last']: # the job finishes after its last layer, there is nothing to pause
+            await client.wait_for_channel(step.channel, events = ('finished', 'stopped'), timeout = step.timeout, subscription = run)
+            return
+
+    # The machine pauses once the current layer is finished, so this returns as soon as the layer is sintered.
+    await client.pause_job(channel_id = step.channel, timeout = step.timeout)
+
+STEP_FUNCTIONS = {
+    'move': moveFunction,
+    'arm': armFunction,
+    'dispense': dispenseFunction,
+    'dry': dryingFunction,
+    'sinter': sinterFunction,
+}
+
+# Runs one step of the schedule | stage(step) can return a context manager around every step, e.g. to time it
+async def runStep(client, step, stage = None):
+    if step.kind == 'sinter':
+        print(f"\nCurrent Layer: {step.layer} | sintering\n")
+    with stage(step) if stage else contextlib.nullcontext():
+        await STEP_FUNCTIONS[step.kind](client, step)
+
+# Runs the steps of the schedule | independent hardware runs at the same time, see stageScheduler.py
+# sequential: one step at a time, in the order of the schedule
+async def runSchedule(client, steps, stage = None, skip = (), sequential = False):
+    try:
+        await runSteps(steps, lambda step: runStep(client, step, stage), skip = skip, sequential = sequential)
+    except BaseException: # a trigger armed ahead of a dispense step (armFunction) must not fire after a failure
+        await getDispenser().disarm()
+        raise
+
+async def multiLayerPILMFun(client, schedule, stage = None):
     # Print the Inital Layer of the PILM Process
     print ("Starting Multi-Layer PILM Process ")    
-    print(f"Inital Layer: {initalLayer}\n")
+    print(f"Inital Layer: {schedule.startLayer}")
+    print(f"Estimated build time: {formatTime(schedule.estimate())}\n")
     
     #-------------------------------------------#
-    
-    while currentLayer <= end_layer:
-        print(f"\nCurrent Layer: {currentLayer}")
-        print(f"Loop: {PILM_Loop}")
-        print(f"platformUp: {platformIncrementUp}")
-        print(f"layerThickness: {layerThickness}\n")
-        
-        # Deposition Process Preparation
-        if PILM_Loop == 1: # At the first loop, move slider to center position.
-            await client.execute(channel = 'manual_move', script = centerPos_Slider)
-        
-        if PILM_Loop > 1: # After the first loop, start moving the platform DOWN each following loop
-             await client.execute(channel = 'manual_move', script = slotDiePlatFormHeight_DOWN)
-             
-        await asyncio.sleep(1)
-        
-        # Slot Die Deposition Process
-        await client.execute(channel = 'manual_move', script = slotDieStartPos) # Move slider to the start position of the dispensing process
-        await asyncio.sleep(2)
-
-        if PILM_Loop > 1: # After the first loop, start moving the platform UP each following loop
-            await client.execute(channel = 'manual_move', script = slotDiePlatFormHeight_UP)
-
-
-        await dispenseFunction(client)
-        await asyncio.sleep(5) # wait for the slider to dispense the ink on the PCB 
-        
-        
-        await client.execute(channel='manual_move', script = centerPos_Slider) # Move the slider back to center position
-        await asyncio.sleep(3)
-        
-        # Substrate Drying Process
-        # PSU Functiton goes here
-        # await MutipleChannels_StopWatch
-        await heatPadMutipleChannels(9,3,420,2) # changed to 420s (7min)
-
-        # Start Sintering Process
-        if currentLayer == start_layer:
-            await client.start_job(execution_script = execution_script,layers = [start_layer, end_layer],parts = build_parts) 
-        else:
-            await client.resume_job() # resume the job, but at the next layer | inital is 7, then this will start at layer 8
-
-        await asyncio.sleep(90) # Varies.  Something to adjust, time it for how long the sintering process takes 
-        await client.pause_job() # pauyse the job after the layer is done sintering
-        currentLayer += 1 # Change the current layer to the next layer
-        PILM_Loop += 1 # add 1 to the total loops processed
+    await runSchedule(client, schedule.steps(), stage)
     #-------------------------------------------#
     
-    await client.stop_job() # Stop the job after the while loop is false and exit the program
+    await client.stop_job() # Stop the job after the last layer and exit the program
      
 # -------------------------------------------------------------------------------------------------------------#
 
-# Single Layer PILM Process
-async def singleLayerPILMFunc(client):
-     await client.execute(channel = 'manual_move', script = defaultPlatformHeight) # set the platform to the starting height
-    
+# Single Layer PILM Process | deposition of the first layer of the schedule, drying and sintering are skipped for testing
+async def singleLayerPILMFunc(client, schedule):
      print ("Starting Single-Layer PILM Process")    
-     print(f"Current Layer: {currentLayer}\n")
-        
-     # Deposition Process Preparation
-     await asyncio.sleep(1)
-     await client.execute(channel = 'manual_move', script = centerPos_Slider)
-     await asyncio.sleep(2)
-     await client.execute(channel = 'manual_move', script = slotDieStartPos)
+     print(f"Current Layer: {schedule.startLayer}\n")
+     await runSchedule(client, schedule.firstLayer().steps(), skip = ('dry', 'sinter'))
      
-     # Slot Die Deposition Process
-     await asyncio.sleep(1)
-     await dispenseFunction(client) # calls the slotDieStartPos and the PILMDispenseOperation
-     await asyncio.sleep(5) # wait for the slider to dispense the ink on the substrate
-
-     # Prepare for the Sintering Process
-     await client.execute(channel='manual_move', script=centerPos_Slider) # Move it back to starting position ## testing
-    
-    # Substrate Drying Process
-    #PSU function Goes Here
-     await asyncio.sleep(3)
-    # #  await MutipleChannels_StopWatch(9,3,2)
-    #  await heatPadMutipleChannels(9,3,600,2)
-
-    # # Sintering Process
-    # #  await client.start_job(execution_script = execution_script,layers = [start_layer, end_layer],parts = build_parts) 
-    #  await asyncio.sleep(5) # Varies. * Something to adjust depending on how long each layer takes*   
-    #  await client.stop_job()
-    
 #------------------------------------------------------------------------------------#
 
 # Conditional statment will cause the program to be executed if it's condition is met.
@@ -291,7 +212,8 @@ if __name__ == '__main__':
         'rest_url' : f'http://192.168.2.201:9000',
         'ws_url' : f'ws://192.168.2.201:9000',
         'email' : 'mshuai@stanford.edu',
-        'password' : 'aconity'
+        'password' : 'aconity',
+        'id_cache_file' : 'aconityIds.json' # job/machine/config ids of the last runs, delete it to look them up again
     }
 
     # LinearizedPower_AlignedAxisToChamber
@@ -305,7 +227,8 @@ if __name__ == '__main__':
         'job_name': 'Said',
         'studio_version': 1
     }
-    result = asyncio.run(executeFunc(login_data, info), debug = True) # required to control the machine * explain 
+    schedule = compileRecipe(loadRecipe(RECIPE_FILE)) # validates the recipe before anything moves
+    result = asyncio.run(executeFunc(login_data, info, schedule), debug = True) # required to control the machine * explain 
   
     
      
\ No newline at end of file
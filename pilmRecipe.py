@@ -0,0 +1,336 @@
+import copy
+import json
+import os
+import sys
+from collections import namedtuple
+
+import stageScheduler
+
+#----Recipes for the PILM process----#
+# A recipe (json file, see recipes/defaultRecipe.json) describes the positions, speeds, dispense, drying and sintering
+# of a build. Settings can be changed for ranges of layers in "layers".
+# compileRecipe() validates the recipe once and turns it into a Schedule: every AconityScript, target position and
+# timeout of every layer is built before the machine moves, so the runner in executeScript only executes the steps.
+# It also estimates the build time.
+#
+# Usage: python pilmRecipe.py [-v] recipes/defaultRecipe.json   (prints the plan and the estimated build time)
+
+RECIPE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recipes')
+DEFAULT_RECIPE = os.path.join(RECIPE_DIR, 'defaultRecipe.json')
+
+#--- Execution scripts for single and multi-layer sintering | recipes refer to them by name ---#
+
+singleLayerSinter = \
+'''layer= function(){
+for(p:$p){
+    $m.expose(p[next;$h],$c[scanner_1])
+}
+  $m.inc_h($g)
+}
+
+repeat(layer)'''
+
+# Will not repeat the same layer. Example: If its from layers 1 to 10, the first iteration will be layers 1 and 2.
+# It will not be layer 1 and then layer 1 again.
+doubleLayerSinter = \
+'''
+layer = function(){
+    for(p:$p){
+        $m.expose(p[next;$h],$c[scanner_1])
+    }
+    $m.inc_h($g)
+}
+
+repeat(2,layer)
+
+'''
+
+multiLayerSinter = \
+'''layer = function(){
+    for(p:$p){
+        $m.expose(p[next;$h],$c[scanner_1])
+    }
+    $m.inc_h($g)
+}
+
+repeat(3,layer)'''
+
+sinterConfigs = {
+      'single_Layer' : singleLayerSinter,
+      'double_Layer' : doubleLayerSinter,
+      'multi_Layer' :  multiLayerSinter
+}
+
+# Keys a recipe can have | (type, minimum) of every setting, None for no minimum
+SETTINGS = {
+    'slider': {'center': (float, None), 'start': (float, None), 'end': (float, None), 'speed': (float, 0),
+               'dispenseSpeed': (float, 0), 'motionThreshold': (float, 0)},
+    'platform': {'defaultHeight': (float, None), 'layerThickness': (float, 0), 'lift': (float, 0), 'speed': (float, 0),
+                 'overlapSliderMoves': (bool, None)},
+    'dispense': {'preTriggerTime': (float, 0), 'triggerTime': (float, 0)},
+    'drying': {'voltage': (float, 0), 'amps': (float, 0), 'time': (int, 0), 'channels': (int, 1)},
+    'sintering': {'layerTime': (float, 0)},
+    'timeouts': {'move': (float, 0), 'sinter': (float, 0)},
+}
+LAYER_SECTIONS = ('slider', 'platform', 'dispense', 'drying', 'sintering') # sections a layer range can override
+JOB_KEYS = {'startLayer', 'endLayer', 'sinterScript', 'parts', 'channel'}
+
+# One command of the schedule.
+# name: unique name (e.g. '9.platform_down') | stage: name of the step in the layer (e.g. 'platform_down')
+# kind: 'move', 'arm', 'dispense', 'dry' or 'sinter'
+# script: AconityScript (moves and dispense) | axis/target: position the step waits for | origin: position before the step
+# duration: estimated seconds | resources: hardware the step uses | after: names of the steps it waits for
+# (see stageScheduler.py for how steps run concurrently)
+Step = namedtuple('Step', 'name stage kind layer channel script axis target origin timeout duration options resources after',
+                  defaults = (None, None, None, None, None, None, 0.0, {}, (), ()))
+
+# All steps of one layer | loop starts at 1, start/end are the planned times in the build in s
+LayerPlan = namedtuple('LayerPlan', 'layer loop steps start end')
+
+class Schedule:
+    def __init__(self, recipe, setup, layers):
+        self.recipe = recipe
+        self.setup = setup # steps before the first layer
+        self.layers = layers # LayerPlan for every layer
+
+    @property
+    def startLayer(self):
+        return self.recipe['job']['startLayer']
+
+    @property
+    def endLayer(self):
+        return self.recipe['job']['endLayer']
+
+    # Every step of the build in order
+    def steps(self):
+        return list(self.setup) + [step for plan in self.layers for step in plan.steps]
+
+    # Estimated build time in s | sequential: without running independent steps at the same time
+    def estimate(self, sequential = False):
+        return max((end for start, end in stageScheduler.plan(self.steps(), sequential)), default = 0.0)
+
+    # Only the first layer, e.g. for a single-layer run
+    def firstLayer(self):
+        return Schedule(self.recipe, self.setup, self.layers[:1])
+
+    def printPlan(self, verbose = False):
+        job = self.recipe['job']
+        print(f"Layers: {job['startLayer']} - {job['endLayer']} ({len(self.layers)} PILM loops)")
+        print(f"Sinter script: {job['sinterScript'] if job['sinterScript'] in sinterConfigs else 'custom'}")
+        timeline = dict(zip((step.name for step in self.steps()), stageScheduler.plan(self.steps())))
+        for plan in self.layers:
+            print(f"Layer {plan.layer}: {formatTime(plan.start)} - {formatTime(plan.end)}")
+            if verbose:
+                for step in plan.steps:
+                    start, end = timeline[step.name]
+                    print(f"   {formatTime(start)} - {formatTime(end)}   {step.stage:<18} {step.script or ''}")
+        print(f"Estimated build time: {formatTime(self.estimate())} (one step at a time: {formatTime(self.estimate(sequential = True))})")
+
+def formatTime(seconds):
+    mins, secs = divmod(int(round(seconds)), 60)
+    hours, mins = divmod(mins, 60)
+    return f'{hours:d}:{mins:02d}:{secs:02d}'
+
+#----Loading and validating----#
+def loadRecipe(path = DEFAULT_RECIPE):
+    with open(path) as file:
+        return json.load(file)
+
+# Merges the settings of a layer range into the base settings
+def mergeSettings(base, override):
+    merged = copy.deepcopy(base)
+    for section in LAYER_SECTIONS:
+        merged[section].update({key: value for key, value in override.get(section, {}).items() if not key.startswith('_')})
+    return merged
+
+def checkSection(name, section, errors, required = True):
+    if not isinstance(section, dict):
+        errors.append(f'{name} must be an object')
+        return
+    types = SETTINGS[name.split('.')[-1]]
+    for key, value in section.items():
+        if key.startswith('_'): # comments
+            continue
+        if key not in types:
+            errors.append(f'{name}.{key} is not a known setting')
+            continue
+        kind, minimum = types[key]
+        if kind is bool:
+            if not isinstance(value, bool):
+                errors.append(f'{name}.{key} must be true or false, not {value!r}')
+        elif isinstance(value, bool) or not isinstance(value, (int, float)) or (kind is int and not isinstance(value, int)):
+            errors.append(f'{name}.{key} must be a{"n integer" if kind is int else " number"}, not {value!r}')
+        elif minimum is not None and (value <= minimum if minimum == 0 else value < minimum):
+            errors.append(f'{name}.{key} must be {"> 0" if minimum == 0 else f">= {minimum}"}, not {value!r}')
+    if required: # switches (true/false) are optional
+        errors.extend(f'{name}.{key} is missing' for key, (kind, minimum) in types.items() if key not in section and kind is not bool)
+
+def checkSettings(name, settings, errors):
+    if settings['slider']['start'] == settings['slider']['end']:
+        errors.append(f'{name}: slider start and end are the same position')
+    if settings['drying']['channels'] > 3:
+        errors.append(f'{name}: drying.channels must be 1, 2 or 3 (channels of the DP800)')
+
+# Raises ValueError with every problem found
+def validateRecipe(recipe):
+    errors = []
+    if not isinstance(recipe, dict):
+        raise ValueError('a recipe must be a json object')
+    unknown = set(recipe) - set(SETTINGS) - {'job', 'moveChannel', 'layers'}
+    errors.extend(f'{key} is not a known section' for key in sorted(unknown) if not key.startswith('_'))
+
+    job = recipe.get('job', {})
+    errors.extend(f'job.{key} is missing' for key in ('startLayer', 'endLayer', 'sinterScript') if key not in job)
+    errors.extend(f'job.{key} is not a known setting' for key in sorted(set(job) - JOB_KEYS) if not key.startswith('_'))
+    startLayer, endLayer = job.get('startLayer'), job.get('endLayer')
+    if not all(isinstance(layer, int) and not isinstance(layer, bool) for layer in (startLayer, endLayer)):
+        errors.append('job.startLayer and job.endLayer must be integers')
+        startLayer = endLayer = None
+    elif startLayer < 1 or endLayer < startLayer:
+        errors.append(f'job layers {startLayer} - {endLayer} are not a valid range')
+    script = job.get('sinterScript')
+    if script is not None and (not isinstance(script, str) or (script not in sinterConfigs and '$m.' not in script)):
+        errors.append(f'job.sinterScript must be one of {sorted(sinterConfigs)} or an AconityScript')
+
+    for name in SETTINGS:
+        checkSection(name, recipe.get(name, {}), errors)
+    settingsValid = not errors # the layer ranges can only be merged into valid settings
+    if settingsValid:
+        checkSettings('recipe', recipe, errors)
+
+    covered = {}
+    for index, layerRange in enumerate(recipe.get('layers', [])):
+        name = f'layers[{index}]'
+        if not isinstance(layerRange, dict):
+            errors.append(f'{name} must be an object')
+            continue
+        first, last = layerRange.get('from'), layerRange.get('to', layerRange.get('from'))
+        if not all(isinstance(layer, int) and not isinstance(layer, bool) for layer in (first, last)):
+            errors.append(f'{name}: "from" and "to" must be integers')
+            continue
+        if startLayer is not None and (first < startLayer or last > endLayer or last < first):
+            errors.append(f'{name}: layers {first} - {last} are not within the job layers {startLayer} - {endLayer}')
+        for layer in range(first, last + 1):
+            if layer in covered:
+                errors.append(f'{name}: layer {layer} is already set by layers[{covered[layer]}]')
+                break
+            covered[layer] = index
+        for key, section in layerRange.items():
+            if key in ('from', 'to') or key.startswith('_'):
+                continue
+            if key not in LAYER_SECTIONS:
+                errors.append(f'{name}: {key} can not be changed per layer (only {", ".join(LAYER_SECTIONS)})')
+                continue
+            checkSection(f'{name}.{key}', section, errors, required = False)
+        if settingsValid and not errors:
+            checkSettings(name, mergeSettings(recipe, layerRange), errors)
+
+    if errors:
+        raise ValueError('invalid recipe:\n   ' + '\n   '.join(errors))
+
+#----Compiling----#
+def moveScript(axis, position, speed):
+    return f'$m.move_abs($c[{axis}],{position:.3f},{speed:g})'
+
+def moveStep(stage, layer, channel, axis, origin, target, speed, timeout, after = ()):
+    return Step(f'{layer}.{stage}', stage, 'move', layer, channel, moveScript(axis, target, speed), axis, target, origin, timeout,
+                abs(target - origin) / speed, resources = (axis,), after = after)
+
+def settingsForLayer(recipe, layer):
+    for layerRange in recipe.get('layers', []):
+        if layerRange['from'] <= layer <= layerRange.get('to', layerRange['from']):
+            return mergeSettings(recipe, layerRange)
+    return recipe
+
+# Validates the recipe and builds every step of the build
+# The steps say which hardware they use and what they wait for, see stageScheduler.py. Steps on the same hardware run
+# in the order they are added here.
+def compileRecipe(recipe):
+    validateRecipe(recipe)
+    recipe = copy.deepcopy(recipe)
+    job = recipe['job']
+    job.setdefault('parts', 'all')
+    job.setdefault('channel', 'run0')
+    channel = recipe.get('moveChannel', 'manual_move')
+    moveTimeout, sinterTimeout = recipe['timeouts']['move'], recipe['timeouts']['sinter']
+    executionScript = sinterConfigs.get(job['sinterScript'], job['sinterScript'])
+
+    platform = recipe['platform']
+    platformPos = platform['defaultHeight']
+    sliderPos = recipe['slider']['center'] # assumed start position, only used for the estimate
+    home = moveStep('platform_home', 'setup', channel, 'platform', platformPos, platformPos, platform['speed'], moveTimeout)
+    setup = [home]
+
+    layerSteps = []
+    sinter = None # sinter step of the last layer
+    for loop, layer in enumerate(range(job['startLayer'], job['endLayer'] + 1), start = 1):
+        settings = settingsForLayer(recipe, layer)
+        slider, platform = settings['slider'], settings['platform']
+        dispense, drying = settings['dispense'], settings['drying']
+        # overlapSliderMoves: the platform moves while the slider moves to the start, instead of before
+        overlap = platform.get('overlapSliderMoves', False)
+        previous = (sinter.name,) if sinter else () # nothing moves before the last layer is sintered
+        steps = []
+
+        # Deposition process preparation | the platform moves down, so the slider can pass over the last layer
+        if loop == 1:
+            steps.append(moveStep('slider_to_center', layer, channel, 'slider', sliderPos, slider['center'], slider['speed'], moveTimeout,
+                                  after = () if overlap else (home.name,)))
+            sliderPos = slider['center']
+            ready = ()
+        else:
+            down = platformPos + platform['lift']
+            steps.append(moveStep('platform_down', layer, channel, 'platform', platformPos, down, platform['speed'], moveTimeout, after = previous))
+            ready = previous if overlap else (steps[-1].name,)
+        steps.append(moveStep('slider_to_start', layer, channel, 'slider', sliderPos, slider['start'], slider['speed'], moveTimeout, after = ready))
+        if loop > 1: # back up, one layer thickness lower than before
+            up = platformPos + platform['layerThickness']
+            steps.append(moveStep('platform_up', layer, channel, 'platform', down, up, platform['speed'], moveTimeout, after = (steps[-1].name,)))
+            platformPos = up
+
+        # Slot-die deposition | the slider moves to the end position while the ink is dispensed
+        # The trigger is only armed once the last layer is sintered and the axes are in position: an armed trigger waits for
+        # an edge on the trigger line, and a stray edge must not dispense onto a substrate that is still under the laser.
+        steps.append(Step(f'{layer}.dispense_arm', 'dispense_arm', 'arm', layer, resources = ('daq',),
+                          after = previous + (steps[-2].name, steps[-1].name), options = {
+            'preTriggerTime': dispense['preTriggerTime'],
+            'triggerTime': dispense['triggerTime'],
+        }))
+        dispenseMove = moveStep('dispense', layer, channel, 'slider', slider['start'], slider['end'], slider['dispenseSpeed'], moveTimeout,
+                                after = (steps[-1].name, steps[-2].name))
+        steps.append(dispenseMove._replace(kind = 'dispense', resources = ('slider', 'daq'),
+                                           duration = max(dispenseMove.duration, dispense['triggerTime']),
+                                           options = {'motionThreshold': slider['motionThreshold']}))
+        dispensed = (steps[-1].name,)
+
+        # Drying | the slider moves back to the center in the meantime
+        steps.append(Step(f'{layer}.drying', 'drying', 'dry', layer, duration = drying['time'], resources = ('psu',), after = dispensed, options = {
+            'voltage': drying['voltage'], 'amps': drying['amps'], 'timeInSec': drying['time'], 'numOfChannels': drying['channels'],
+        }))
+        steps.append(moveStep('slider_return', layer, channel, 'slider', slider['end'], slider['center'], slider['speed'], moveTimeout, after = dispensed))
+        sliderPos = slider['center']
+
+        # Sintering | the job is started at the first layer, resumed at the others and paused after every layer but the last
+        sinter = Step(f'{layer}.sinter', 'sinter', 'sinter', layer, job['channel'], timeout = sinterTimeout,
+                      duration = settings['sintering']['layerTime'], resources = ('laser',),
+                      after = (steps[-2].name, steps[-1].name), options = {
+            'first': loop == 1,
+            'last': layer == job['endLayer'],
+            'executionScript': executionScript,
+            'layers': [job['startLayer'], job['endLayer']],
+            'parts': job['parts'],
+            'startTimeout': moveTimeout,
+        })
+        steps.append(sinter)
+        layerSteps.append((layer, loop, tuple(steps)))
+
+    allSteps = setup + [step for _, _, steps in layerSteps for step in steps]
+    timeline = dict(zip((step.name for step in allSteps), stageScheduler.plan(allSteps)))
+    layers = [LayerPlan(layer, loop, steps, timeline[steps[0].name][0], max(timeline[step.name][1] for step in steps))
+              for layer, loop, steps in layerSteps]
+    return Schedule(recipe, tuple(setup), layers)
+
+if __name__ == '__main__':
+    paths = [arg for arg in sys.argv[1:] if arg != '-v']
+    schedule = compileRecipe(loadRecipe(paths[0] if paths else DEFAULT_RECIPE))
+    schedule.printPlan(verbose = '-v' in sys.argv)
@@ -1,21 +1,133 @@
 #------Libraries------#
 import asyncio # for AconityStudio integration
-import pyvisa # frontend to the VISA library
+import threading # lock for the VISA handle
 import time # for delays and timer function
-import keyboard # for keyboard press  
+from concurrent.futures import ThreadPoolExecutor # dedicated I/O thread for the PSU
 #import os # for datalogging
+# pyvisa (frontend to the VISA library) and keyboard (for keyboard press) are imported on first use,
+# so importing this module does not load any driver or touch the USB bus.
 #---------------------#
-# Getting ID of PSU and preparing for configuration
-rm = pyvisa.ResourceManager() # create resource manager to store ID of  Devices
-print("\nResources detected:\n{}\n".format(rm.list_resources())) # list the avaiable VISA resources for Compatible Devices
+# ID of the PSU | This is where you will add the ID of the PSU
+PSU_ID = 'USB0::0x1AB1::0x0E11::DP8C243004769::INSTR'
 
-#-- Need psu to be plugged in and it's id for the script to work--#
-powerSupply = rm.open_resource('USB0::0x1AB1::0x0E11::DP8C243004769::INSTR') # open the VISA resource for the power supply unit | This is where you will add the ID of the PSU
-#print(powerSupply.query("*IDN?")) # will open the VISA resource tied to the psu and print the name of the psu. - Can be used for testing purposes -
+#---------------------#
+# Power supply unit (Rigol DP800) | Opens the VISA resource once and reuses it for every layer.
+class PowerSupply:
+    def __init__(self, resourceName = PSU_ID, visaLibrary = '', retries = 1):
+        self.resourceName = resourceName # VISA id of the PSU
+        self.visaLibrary = visaLibrary # '' for the default VISA library, e.g. 'psu.yaml@sim' for pyvisa-sim
+        self.retries = retries # how often a failed command is repeated after reconnecting
+        self._rm = None
+        self._resource = None
+        self._lock = threading.Lock() # only one command at a time on the handle
+        self._executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = 'psu-io') # every async command runs on this thread
+
+    # Opens the VISA resource if it's not open yet and returns it
+    def open(self):
+        import pyvisa
+        if self._resource is None:
+            if self._rm is None:
+                self._rm = pyvisa.ResourceManager(self.visaLibrary)
+            self._resource = self._rm.open_resource(self.resourceName)
+            self._resource.write_termination = self._resource.read_termination = '\n' # the DP800 ends every message with LF
+            print(f"Connected to PSU {self.resourceName}")
+        return self._resource
+
+    # Closes the VISA resource | The next command opens it again
+    def close(self):
+        import pyvisa
+        if self._resource is not None:
+            try:
+                self._resource.close()
+            except pyvisa.errors.Error:
+                pass # the handle is dead anyway
+        self._resource = None
+
+    # Sends a command and reconnects if the handle failed
+    def _call(self, method, command):
+        import pyvisa
+        with self._lock:
+            for attempt in range(self.retries + 1):
+                try:
+                    return getattr(self.open(), method)(command)
+                except (pyvisa.errors.Error, OSError) as e:
+                    print(f"PSU command {command} failed ({e}). Reconnecting.")
+                    self.close()
+                    if attempt == self.retries:
+                        raise
+
+    def write(self, command):
+        return self._call('write', command)
+
+    def query(self, command):
+        return self._call('query', command)
+
+    # Sets the voltage and current of several channels and turns them on with one command. | setpoints = {channel: (voltage, amps)}
+    # With waitForCompletion the PSU answers *OPC? once all channels are on, so the function only returns after that.
+    def applyChannels(self, setpoints, waitForCompletion = True):
+        commands = [f':APPL CH{channel},{voltage},{amps}' for channel, (voltage, amps) in setpoints.items()]
+        commands += [f':OUTP CH{channel},ON' for channel in setpoints]
+        return self.sendBatch(commands, waitForCompletion)
+
+    # Turns off several channels with one command
+    def outputOff(self, channels, waitForCompletion = True):
+        return self.sendBatch([f':OUTP CH{channel},OFF' for channel in channels], waitForCompletion)
+
+    # Joins SCPI commands with ';' and sends them as a single transaction
+    # With waitForCompletion the *OPC? reply is checked | Raises a RuntimeError (with the PSU error queue) if it is not 1
+    def sendBatch(self, commands, waitForCompletion = True):
+        batch = ';'.join(commands)
+        if not waitForCompletion:
+            return self.write(batch)
+        reply = self.query(batch + ';*OPC?').strip()
+        if reply != '1':
+            try:
+                error = self.query(':SYST:ERR?').strip()
+            except Exception as e:
+                error = f'error queue not readable: {e}'
+            raise RuntimeError(f"PSU did not complete {batch} (reply {reply!r}, {error})")
+        return reply
+
+    # Async versions | The VISA I/O runs on the PSU thread, so the event loop is never blocked
+    async def _runAsync(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def writeAsync(self, command):
+        return await self._runAsync(self.write, command)
+
+    async def queryAsync(self, command):
+        return await self._runAsync(self.query, command)
+
+    async def applyChannelsAsync(self, setpoints, waitForCompletion = True):
+        return await self._runAsync(self.applyChannels, setpoints, waitForCompletion)
+
+    async def outputOffAsync(self, channels, waitForCompletion = True):
+        return await self._runAsync(self.outputOff, channels, waitForCompletion)
+
+# Lazy factory for the shared PSU | Nothing is opened until the first command is sent
+_powerSupply = None
+def getPowerSupply():
+    global _powerSupply
+    if _powerSupply is None:
+        _powerSupply = PowerSupply()
+    return _powerSupply
+
+# Replaces the shared PSU, e.g. with PowerSupply(visaLibrary = 'psu.yaml@sim') for a simulated PSU
+def setPowerSupply(powerSupply):
+    global _powerSupply
+    _powerSupply = powerSupply
+
+# list the avaiable VISA resources for Compatible Devices
+def listResources():
+    import pyvisa
+    rm = pyvisa.ResourceManager()
+    print("\nResources detected:\n{}\n".format(rm.list_resources()))
+    #print(powerSupply.query("*IDN?")) # will open the VISA resource tied to the psu and print the name of the psu. - Can be used for testing purposes -
 
 #---------------------#
 # function for one channel test | Does not need any parameters, it will do everything within the function when called
 def oneChannelPsuTest():
+    powerSupply = getPowerSupply() # shared PSU, connects on first use
     testDone = False # for while loop condition
     userInput = 0 # stores the value of the user
     
@@ -70,6 +182,7 @@ def oneChannelPsuTest():
 #---------------------#
 # function for multiple channel test | Does not need any parameters, it will do everything within the function when called
 def multipleChannelsPsuTest():
+    powerSupply = getPowerSupply() # shared PSU, connects on first use
     testDone = False # for while loop condition
     userInput = 0  # stores the value of the user
     
@@ -179,7 +292,17 @@ def timerFunction(timeInSec):
         time.sleep(1) 
         timeInSec -= 1 # reduce the total input time by 1 each repetition.
 
+# Timer function for the PILM process | Same as timerFunction, but does not block the event loop (websocket, ping, etc. keep running)
+async def asyncTimerFunction(timeInSec):
+    while timeInSec:
+        mins, secs = divmod(timeInSec, 60)
+        timer = '{:02d}:{:02d}'.format(mins, secs)
+        print("Time left:",timer, end="\r")
+        await asyncio.sleep(1)
+        timeInSec -= 1
+
 def stopWatchFunction():
+    import keyboard
     timeInSec = 0
     space_pressed = False 
 
@@ -197,119 +320,78 @@ def stopWatchFunction():
             space_pressed = True   
                 
     print(f"\nTotal Time: {timeInSec}s")     
+
+# Stopwatch for the PILM process | Same as stopWatchFunction, but does not block the event loop
+async def asyncStopWatchFunction():
+    import keyboard
+    timeInSec = 0
+    print("\nTimer is on. Hold space to stop PSU Channels")
+    while not keyboard.is_pressed('space'):
+        mins, secs = divmod(timeInSec, 60)
+        timer = '{:02d}:{:02d}'.format(mins, secs)
+        print("Time Active:",timer, end="\r")
+        await asyncio.sleep(1)
+        timeInSec += 1
+    print(f"\nTotal Time: {timeInSec}s")
              
 #----------------------------#
 
 #------AconityStudio Integration----------------------#
-# Main function with one channel. | Voltage and Amps are float values. timeInSec is int
-async def heatPadOneChannel(voltage,amps,timeInSec):  
-    #-Getting ID of PSU and preparing for PILM Process-#
-    rm = pyvisa.ResourceManager() # create resource manager to find id for PSU
-    powerSupply = rm.open_resource('USB0::0x1AB1::0x0E11::DP8C243004769::INSTR') # open the VISA resource for the power supply unit
-    powerSupply.write(':OUTP CH1, ON')  
-    print("Channel 1 is Active\n")
-    #--------------------------------------------------#
-    powerSupply.write(f':APPL CH1, {str(voltage)},{str(amps)}') # applies chosen voltage and amps to CH1
+# Prints the active channels and their setpoints
+def printActiveChannels(channels,voltage,amps):
+    names = [f"Channel {channel}" for channel in channels]
+    if len(names) == 1:
+        print(f"{names[0]} is Active")
+    else:
+        print(", ".join(names[:-1]) + f"{',' if len(names) > 2 else ''} and {names[-1]} are Active")
     print("Voltage: " + str(voltage) + "V")
     print("Current: " + str(amps) + "A") 
-    
-    timerFunction(timeInSec) # call the timer function and start the timer at the selected seconds. | Will move on to the next code statement after it's finished.
-    powerSupply.write(':OUTP CH1, OFF') # turn off the channel after the timer reaches 0.
 
-# Main function with multiple channels. 
+# Main function with one channel. | Voltage and Amps are float values. timeInSec is int
+async def heatPadOneChannel(voltage,amps,timeInSec):  
+    powerSupply = getPowerSupply() # shared PSU, connects on first use
+    #-Using the shared PSU for the PILM Process-#
+    try: # the output is turned off even if applying failed or was cancelled half-way
+        await powerSupply.applyChannelsAsync({1: (voltage, amps)}) # applies chosen voltage and amps to CH1 and turns it on
+        printActiveChannels([1],voltage,amps)
+        #--------------------------------------------------#
+        await asyncTimerFunction(timeInSec) # start the timer at the selected seconds. | Other coroutines keep running in the meantime.
+    finally:
+        await powerSupply.outputOffAsync([1]) # turn off the channel after the timer reaches 0 (or the drying was cancelled).
+
+# Main function with multiple channels. | All channels are switched on at once
 async def heatPadMutipleChannels(voltage,amps,timeInSec,numOfChannels): # numOfChannels is a int val. 
-    rm = pyvisa.ResourceManager()
-    powerSupply = rm.open_resource('USB0::0x1AB1::0x0E11::DP8C243004769::INSTR')
-    
-    
-    if numOfChannels == 1:
-        powerSupply.write(':OUTP CH1, ON') 
-        print("Channel 1 is Active")
-        powerSupply.write(f':APPL CH1, {str(voltage)},{str(amps)}') 
-        print("Voltage: " + str(voltage) + "V")
-        print("Current: " + str(amps) + "A") 
-        
-        timerFunction(timeInSec)
-        powerSupply.write(':OUTP CH1, OFF')
-    elif numOfChannels == 2:
-        powerSupply.write(':OUTP CH1, ON')
-        powerSupply.write(':OUTP CH2, ON')
-        
-        print("Channel 1 and Channel 2 are Active")
-        powerSupply.write(f':APPL CH1, {str(voltage)},{str(amps)}')
-        powerSupply.write(f':APPL CH2, {str(voltage)},{str(amps)}')
-        print("Voltage: " + str(voltage) + "V")
-        print("Current: " + str(amps) + "A") 
-        
-        timerFunction(timeInSec)
-        powerSupply.write(':OUTP CH1, OFF')
-        powerSupply.write(':OUTP CH2, OFF')     
-    elif numOfChannels == 3:
-        powerSupply.write(':OUTP CH1, ON')
-        powerSupply.write(':OUTP CH2, ON')
-        powerSupply.write(':OUTP CH3, ON')
-        
-        print("Channel 1, Channel 2, and Channel 3 are Active")
-        powerSupply.write(f':APPL CH1, {str(voltage)},{str(amps)}')
-        powerSupply.write(f':APPL CH2, {str(voltage)},{str(amps)}')
-        powerSupply.write(f':APPL CH3, {str(voltage)},{str(amps)}')
-        print("Voltage: " + str(voltage) + "V")
-        print("Current: " + str(amps) + "A") 
-        
-        timerFunction(timeInSec)
-        powerSupply.write(':OUTP CH1, OFF')
-        powerSupply.write(':OUTP CH2, OFF')
-        powerSupply.write(':OUTP CH3, OFF')     
-    else:
+    powerSupply = getPowerSupply() # shared PSU, connects on first use
+    if numOfChannels not in (1, 2, 3):
         print("Wrong Input,Try Again. 1|2|3") # won't really be needed. Just in case.
+        return
+    channels = range(1, numOfChannels + 1)
 
-# Main function with multiple channels. | Will require user input to stop channel outputs.
-async def MutipleChannels_StopWatch(voltage,amps,numOfChannels): # numOfChannels is a int val. 
-    rm = pyvisa.ResourceManager()
-    powerSupply = rm.open_resource('USB0::0x1AB1::0x0E11::DP8C243004769::INSTR')
-    
-    
-    if numOfChannels == 1:
-        powerSupply.write(':OUTP CH1, ON') 
-        print("Channel 1 is Active")
-        powerSupply.write(f':APPL CH1, {str(voltage)},{str(amps)}') 
-        print("Voltage: " + str(voltage) + "V")
-        print("Current: " + str(amps) + "A") 
+    try: # the outputs are turned off even if applying failed or was cancelled half-way
+        await powerSupply.applyChannelsAsync({channel: (voltage, amps) for channel in channels})
+        printActiveChannels(channels,voltage,amps)
+        await asyncTimerFunction(timeInSec)
+    finally:
+        await powerSupply.outputOffAsync(channels)
 
-        stopWatchFunction()
-        powerSupply.write(':OUTP CH1, OFF')
+# Starts the drying in the background and returns the task. | await the task to wait for the end of the drying, cancel it to stop early (the channels are turned off either way).
+def startDrying(voltage,amps,timeInSec,numOfChannels):
+    return asyncio.create_task(heatPadMutipleChannels(voltage,amps,timeInSec,numOfChannels))
 
-    elif numOfChannels == 2:
-        powerSupply.write(':OUTP CH1, ON')
-        powerSupply.write(':OUTP CH2, ON')
-        
-        print("Channel 1 and Channel 2 are Active")
-        powerSupply.write(f':APPL CH1, {str(voltage)},{str(amps)}')
-        powerSupply.write(f':APPL CH2, {str(voltage)},{str(amps)}')
-        print("Voltage: " + str(voltage) + "V")
-        print("Current: " + str(amps) + "A") 
-        
-        stopWatchFunction()
-        powerSupply.write(':OUTP CH1, OFF')
-        powerSupply.write(':OUTP CH2, OFF')     
-    elif numOfChannels == 3:
-        powerSupply.write(':OUTP CH1, ON')
-        powerSupply.write(':OUTP CH2, ON')
-        powerSupply.write(':OUTP CH3, ON')
-        
-        print("Channel 1, Channel 2, and Channel 3 are Active")
-        powerSupply.write(f':APPL CH1, {str(voltage)},{str(amps)}')
-        powerSupply.write(f':APPL CH2, {str(voltage)},{str(amps)}')
-        powerSupply.write(f':APPL CH3, {str(voltage)},{str(amps)}')
-        print("Voltage: " + str(voltage) + "V")
-        print("Current: " + str(amps) + "A") 
-        
-        stopWatchFunction()
-        powerSupply.write(':OUTP CH1, OFF')
-        powerSupply.write(':OUTP CH2, OFF')
-        powerSupply.write(':OUTP CH3, OFF')     
-    else:
+# Main function with multiple channels. | Will require user input to stop channel outputs.
+async def MutipleChannels_StopWatch(voltage,amps,numOfChannels): # numOfChannels is a int val. 
+    powerSupply = getPowerSupply() # shared PSU, connects on first use
+    if numOfChannels not in (1, 2, 3):
         print("Wrong Input,Try Again. 1|2|3")
+        return
+    channels = range(1, numOfChannels + 1)
+
+    try: # the outputs are turned off even if applying failed or was cancelled half-way
+        await powerSupply.applyChannelsAsync({channel: (voltage, amps) for channel in channels})
+        printActiveChannels(channels,voltage,amps)
+        await asyncStopWatchFunction()
+    finally:
+        await powerSupply.outputOffAsync(channels)
 #---------------------------------#
 # Test Functions Here # 
 
@@ -0,0 +1,92 @@
+import asyncio
+
+#----Stage scheduler for the PILM process----#
+# Runs the steps of a schedule (see pilmRecipe.py) concurrently where that is safe.
+# Every step declares the hardware it uses (step.resources) and the steps it needs to be finished first (step.after).
+# A step starts as soon as
+#   - all steps in step.after are done and
+#   - every earlier step that uses the same resource, or a resource interlocked with one of its own, is done.
+# So two steps on the same axis always run in the order of the schedule, independent hardware (e.g. heat pads and the
+# slider, or drying while the slider moves back) runs at the same time, and interlocked hardware never overlaps.
+# The same rules give the planned timeline of the build, see plan().
+
+RESOURCES = ('slider', 'platform', 'psu', 'daq', 'laser')
+
+# Resources that must never be active at the same time
+INTERLOCKS = {
+    frozenset(('slider', 'laser')): 'never move the slider during exposure',
+    frozenset(('platform', 'laser')): 'never move the platform during exposure',
+}
+
+def conflict(resourcesA, resourcesB):
+    for a in resourcesA:
+        for b in resourcesB:
+            if a == b or frozenset((a, b)) in INTERLOCKS:
+                return True
+    return False
+
+def conflicting(resource):
+    return {resource} | {other for pair in INTERLOCKS if resource in pair for other in pair}
+
+# Returns for every step the indices of the steps it has to wait for | Raises ValueError for an invalid schedule
+def predecessors(steps, sequential = False):
+    index = {}
+    lastUser = {} # resource -> index of the last step using it | earlier users are done before that one
+    waitFor = []
+    for i, step in enumerate(steps):
+        if step.name in index:
+            raise ValueError(f'step {step.name} is in the schedule twice')
+        unknown = set(step.resources) - set(RESOURCES)
+        if unknown:
+            raise ValueError(f'step {step.name} uses unknown resources {sorted(unknown)}')
+        for name in step.after:
+            if name not in index: # steps can only wait for earlier steps, so there are no cycles
+                raise ValueError(f'step {step.name} waits for {name}, which is not an earlier step of the schedule')
+        if sequential:
+            waitFor.append({i - 1} if i else set())
+        else:
+            waitFor.append({index[name] for name in step.after} |
+                           {lastUser[other] for resource in step.resources for other in conflicting(resource) if other in lastUser})
+        index[step.name] = i
+        for resource in step.resources:
+            lastUser[resource] = i
+    return waitFor
+
+# Planned (start, end) of every step in seconds, from the estimated durations
+def plan(steps, sequential = False):
+    timeline = []
+    for step, before in zip(steps, predecessors(steps, sequential)):
+        start = max((timeline[j][1] for j in before), default = 0.0)
+        timeline.append((start, start + step.duration))
+    return timeline
+
+# Runs every step with 'await run(step)' | steps whose kind is in skip count as done right away
+# If a step fails, the running steps are cancelled and the error is raised.
+async def runSteps(steps, run, skip = (), sequential = False):
+    steps = list(steps)
+    waitFor = predecessors(steps, sequential)
+    done = [asyncio.Event() for _ in steps]
+    active = {} # step index -> resources in use, to check the interlocks while running
+
+    async def runStep(i):
+        step = steps[i]
+        for j in waitFor[i]:
+            await done[j].wait()
+        if step.kind not in skip:
+            for j, resources in active.items():
+                if conflict(step.resources, resources): # can only happen if the rules above are broken
+                    raise RuntimeError(f'{step.name} would run together with {steps[j].name}')
+            active[i] = step.resources
+            try:
+                await run(step)
+            finally:
+                del active[i]
+        done[i].set()
+
+    tasks = [asyncio.create_task(runStep(i)) for i in range(len(steps))]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions = True)
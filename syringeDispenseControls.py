@@ -1,8 +1,11 @@
 import asyncio # for AconityStudio integration
-import nidaqmx # library for national instruments controls| For DAC USB 6009
 import time # for delay functions
+from concurrent.futures import ThreadPoolExecutor # dedicated I/O thread for the DAQ
+# nidaqmx (library for national instruments controls| For DAC USB 6009) is imported on first use,
+# so importing this module does not load the NI-DAQmx driver.
 '''
 #--Analog Input Channels--# (Optional, not needed for overall program)
+import nidaqmx
 task_read = nidaqmx.Task() # creating a function to read voltage from the Syringe Dispenser
 task_read.ai_channels.add_ai_voltage_chan('Dev1/ai0', 'inputChan_0', min_val= 0.00, max_val = 5.00) # create an analog input channel
 task_read.start() # start the analog input channel
@@ -21,6 +24,7 @@ def timerFunction(timeInSec):
 #----Operations----#
 # Function to Test the Syringe Dispenser only # 
 def dispenseOperation(): # This function will serve as the signal to start the dispensing cycle 
+    import nidaqmx
     #--Analog Output Channels--#
     task = nidaqmx.Task() # Create a nidaqmx object that calls the Task() function. This will be used to control the DAQ
     task.ao_channels.add_ao_voltage_chan('Dev1/ao0', 'outputChan_0', min_val = 0.00, max_val = 5.00) # create a analog output channel for voltage at channel ao0 called channel_1
@@ -41,22 +45,162 @@ def dispenseOperation(): # This function will serve as the signal to start the d
     #It's best to configure the cycle settings manually if you want a faster cycle
 
 
+#----Dispenser for the PILM process----#
+# Keeps the analog output task reserved and committed between layers, so a dispense only has to write the trigger.
+# If the DAQ supports hardware timing, the 0 -> 5 -> 0 V trigger is written as one waveform and timed by the DAQ clock.
+# The USB 6009 only has software-timed analog outputs, there the trigger is timed with asyncio.sleep (the event loop keeps running).
+#
+# A dispense can be split in two steps to synchronise it with the slider: arm() prepares the trigger ahead of time,
+# release() fires it (e.g. as soon as the slider starts moving). With a triggerSource (digital line, hardware-timed
+# devices only) the armed waveform is started by the DAQ itself on the edge of that line.
+class DispenseController:
+    def __init__(self, channel = 'Dev1/ao0', triggerVoltage = 5.0, preTriggerTime = 1.0, triggerTime = 3.0,
+                 sampleRate = 1000, hardwareTimed = None, triggerSource = None):
+        self.channel = channel # analog output channel connected to the syringe dispenser
+        self.triggerVoltage = triggerVoltage # voltage which triggers the dispense cycle
+        self.preTriggerTime = preTriggerTime # seconds at 0V before the trigger
+        self.triggerTime = triggerTime # seconds the trigger is held
+        self.sampleRate = sampleRate # samples per second of the hardware-timed waveform
+        self.hardwareTimed = hardwareTimed # None: use hardware timing if the device supports it
+        self.triggerSource = triggerSource # e.g. '/Dev1/PFI0' | digital start trigger of the waveform, None for software start
+        self._task = None
+        self._samples = None # number of samples the sample clock is configured for
+        self._armed = None # None if not armed, else True/False for 'with pre-trigger'
+        self._executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = 'daq-io') # every DAQ call runs on this thread
+
+    # The trigger as samples: 0V (optional), trigger voltage, back to 0V
+    def waveform(self, preTrigger = True):
+        samples = [0.0] * int(round(self.preTriggerTime * self.sampleRate)) if preTrigger else []
+        samples += [float(self.triggerVoltage)] * int(round(self.triggerTime * self.sampleRate))
+        return samples + [0.0]
+
+    # Creates, configures and commits the task | Only done once, the task is reused for every layer
+    def open(self):
+        import nidaqmx
+        from nidaqmx.constants import TaskMode
+        if self._task is not None:
+            return self._task
+
+        task = nidaqmx.Task()
+        try:
+            task.ao_channels.add_ao_voltage_chan(self.channel, 'outputChan_0', min_val = 0.00, max_val = 5.00)
+            if self.hardwareTimed is None:
+                device = nidaqmx.system.Device(self.channel.split('/')[0])
+                self.hardwareTimed = device.ao_samp_clk_supported
+            if self.hardwareTimed:
+                self._configureSampleClock(task, len(self.waveform()))
+                if self.triggerSource:
+                    task.triggers.start_trigger.cfg_dig_edge_start_trig(self.triggerSource)
+            task.control(TaskMode.TASK_COMMIT) # reserve the hardware now instead of at every start
+        except Exception:
+            task.close()
+            raise
+        self._task = task
+        print(f"Dispenser ready on {self.channel} ({'hardware' if self.hardwareTimed else 'software'} timed trigger)")
+        return task
+
+    def _configureSampleClock(self, task, samples):
+        from nidaqmx.constants import AcquisitionType
+        if samples != self._samples:
+            task.timing.cfg_samp_clk_timing(self.sampleRate, sample_mode = AcquisitionType.FINITE, samps_per_chan = samples)
+            self._samples = samples
+
+    # Releases the DAQ | Call at the end of the build
+    def close(self):
+        if self._task is not None:
+            self._task.close()
+            self._task = None
+            self._samples = None
+            self._armed = None
+
+    def _arm(self, preTrigger):
+        task = self.open()
+        if self.hardwareTimed:
+            waveform = self.waveform(preTrigger)
+            self._configureSampleClock(task, len(waveform))
+            task.write(waveform, auto_start = False)
+            if self.triggerSource:
+                task.start() # waits for the edge on the trigger line
+        else:
+            task.write(0, auto_start = True)
+
+    def _start(self):
+        self._task.start()
+
+    def _finish(self):
+        try:
+            self._task.wait_until_done(timeout = self.preTriggerTime + self.triggerTime + 10)
+        finally:
+            self._task.stop() # returns the task to the committed state, also if the trigger did not finish
+
+    def _disarm(self):
+        if self.hardwareTimed:
+            self._task.stop() # a task waiting for the trigger line does not fire anymore
+        else:
+            self._task.write(0, auto_start = True)
+
+    def _write(self, voltage):
+        self.open().write(voltage, auto_start = True)
+
+    # Prepares the trigger, so release() only has to start it
+    async def arm(self, preTrigger = True):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._arm, preTrigger)
+        self._armed = preTrigger
+
+    # Takes back an armed trigger (e.g. if the slider did not move) | Safe to call if nothing is armed
+    async def disarm(self):
+        self._armed = None
+        if self._task is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._disarm)
+
+    # Fires the armed trigger and returns time.perf_counter() of the release (None if started by the trigger line).
+    # Returns once the trigger is back at 0V.
+    async def release(self):
+        loop = asyncio.get_running_loop()
+        if self._armed is None:
+            await self.arm()
+        preTrigger, self._armed = self._armed, None
+
+        print("Starting Dispense Cycle\n")
+        if self.hardwareTimed:
+            releaseTime = None
+            if not self.triggerSource:
+                await loop.run_in_executor(self._executor, self._start)
+                releaseTime = time.perf_counter()
+            await loop.run_in_executor(self._executor, self._finish)
+            return releaseTime
+
+        try:
+            if preTrigger:
+                await asyncio.sleep(self.preTriggerTime)
+            await loop.run_in_executor(self._executor, self._write, self.triggerVoltage) # trigger the cycle
+            releaseTime = time.perf_counter()
+            await asyncio.sleep(self.triggerTime)
+        finally:
+            await loop.run_in_executor(self._executor, self._write, 0)
+        return releaseTime
+
+    # Runs one dispense cycle | Returns once the trigger is back at 0V
+    async def dispense(self):
+        await self.arm()
+        return await self.release()
+
+# Lazy factory for the shared dispenser | The DAQ is only opened with the first dispense
+_dispenser = None
+def getDispenser():
+    global _dispenser
+    if _dispenser is None:
+        _dispenser = DispenseController()
+    return _dispenser
+
+# Replaces the shared dispenser, e.g. with a simulated one that has the same arm/release/dispense methods
+def setDispenser(dispenser):
+    global _dispenser
+    _dispenser = dispenser
+
 # Function For PILM Automation # - tied with the dispenseFunction in executeScript.py
 async def PILMDispenseOperation(): # This function will serve as the signal to start the dispensing cycle
-    #--Analog Output Channels--#
-    task = nidaqmx.Task()
-    task.ao_channels.add_ao_voltage_chan('Dev1/ao0', 'outputChan_0', min_val = 0.00, max_val = 5.00) 
-    task.start() 
-    
-    print("Starting Dispense Cycle\n")
-    task.write(0) 
-    time.sleep(1)
-    task.write(5)
-    timerFunction(3)
-    task.write(0)
-
-    task.stop() # Required | Stop the analog output channel once it's not needed
-    task.close() # Required | Close the channel when done.
+    await getDispenser().dispense()
 
     #Note: You have to wait for the cycle to finish to call it again.
     # You also can't just set it to 0V after it's changed to 5v 